@@ -1,9 +1,28 @@
 # BiovynAI_app.py
+import os
+
 import streamlit as st
-from backend import get_biovyn_response, generate_bio_diagram
+from backend import generate_bio_diagram
+from config import get_setting
+from context import new_context
+from diagrams import get_diagram_prefetcher
+from export import FORMATS, Transcript, bulk_export_file
+from topics import get_topic_index
+from jobs import get_job_manager
+from metrics import get_metrics
+from quiz import get_quiz_bank
+from render import bubble_html
+from residency import get_model_residency
+from cache import get_response_cache
+from router import get_router
+from scheduler import Busy, get_backend_limiter
+from sessions import SessionStore, get_session_store
 
 st.sidebar.success("✅ Frontend ↔ Backend connection confirmed")
 
+# first run in this process starts loading the Ollama models in the background
+get_model_residency()
+
 
 
 # ─────────────────────────────
@@ -64,8 +83,96 @@ button[kind="primary"] {
 st.sidebar.markdown("## 🧬 BiovynAI — Your Biology Study Companion")
 st.sidebar.write("Hello explorer! 🌱 I'm BiovynAI — your pocket biologist trained to make every concept in life science crystal clear 🧠✨")
 st.sidebar.divider()
-st.sidebar.write("✨ **Pro version** with interactive quiz & visual modules *coming soon!* 🌿💡")
+prefetch_diagrams = st.sidebar.toggle(
+    "⚡ Prefetch diagrams",
+    value=get_setting("DIAGRAM_PREFETCH", False, bool),
+    help="Start loading the diagram as soon as an answer mentions a biology topic.",
+)
+if get_setting("ADMIN_PANEL", False, bool):
+    with st.sidebar.expander("📊 Admin: request metrics"):
+        for label, value in get_metrics().summary().items():
+            st.write(f"**{label}:** {value if value is not None else '–'}")
+        _session_stats = get_session_store().stats()
+        st.write(f"**sessions in memory:** {_session_stats['sessions_in_memory']} "
+                 f"({_session_stats['memory_bytes'] // 1024} KB)")
+        _jobs = get_job_manager().stats()
+        st.write(f"**queue:** {_jobs['queued']} waiting · {_jobs['rejected']} turned away")
+        st.write("**backend slots:** " + " · ".join(
+            f"{name} {active}/{limit or '∞'}" for name, (active, limit) in get_backend_limiter().snapshot().items()
+        ))
+        # bulk export for teachers: every stored session, streamed to a file on disk first
+        bulk_format = st.selectbox("All sessions as", list(FORMATS), format_func=lambda f: FORMATS[f][0], key="bulk_format")
+        if st.button("📦 Prepare export of all sessions"):
+            st.session_state.bulk_export = bulk_export_file(get_session_store(), bulk_format)
+        if st.session_state.get("bulk_export"):
+            with open(st.session_state.bulk_export, "rb") as f:
+                st.download_button("📥 Download all sessions", data=f,
+                                   file_name=os.path.basename(st.session_state.bulk_export))
+        st.caption("Full metrics: Prometheus /metrics on METRICS_PORT · events in logs/requests.jsonl")
+
+# ─────────────────────────────
+# 🧪 QUIZ
+# ─────────────────────────────
+# questions come from the pre-generated bank (quiz.py) — no model call while you
+# play; a topic that runs low is topped up in the background
+def _next_quiz_question():
+    # runs before the rerun the click causes, so the new question shows right away
+    st.session_state.quiz_seen.add(st.session_state.quiz_current["id"])
+    st.session_state.quiz_current = None
+
+@st.fragment
+def _quiz_panel():
+    state = st.session_state
+    state.setdefault("quiz_seen", set())
+    state.setdefault("quiz_score", [0, 0])
+    bank = get_quiz_bank()
+    topic = st.selectbox("Topic", sorted(get_topic_index().topics), key="quiz_topic")
+    current = state.get("quiz_current")
+    if current is None or current["topic"] != topic:
+        current = state.quiz_current = bank.next_question(topic, state.quiz_seen)
+        state.quiz_checked = None
+    if current is None:
+        st.caption("Questions for this topic are being prepared — try another one or check back soon ⏳")
+        return
+
+    st.markdown(f"**{current['question']}**")
+    choice = st.radio(
+        "Your answer", range(4), format_func=lambda i: current["options"][i],
+        index=None, key=f"quiz_choice_{current['id']}", label_visibility="collapsed",
+    )
+    col_check, col_next = st.columns(2)
+    with col_check:
+        if st.button("Check", disabled=choice is None or state.quiz_checked is not None, key="quiz_check"):
+            state.quiz_checked = choice
+            state.quiz_score[0] += choice == current["answer"]
+            state.quiz_score[1] += 1
+    with col_next:
+        st.button("Next ➡️", key="quiz_next", on_click=_next_quiz_question)
+    if state.quiz_checked is not None:
+        if state.quiz_checked == current["answer"]:
+            st.success(f"✅ Correct! {current['explanation']}")
+        else:
+            st.error(f"❌ It's **{current['options'][current['answer']]}**. {current['explanation']}")
+    st.caption(f"Score: {state.quiz_score[0]}/{state.quiz_score[1]}")
+
+if get_setting("QUIZ_ENABLED", True, bool):
+    with st.sidebar.expander("🧪 Quiz yourself"):
+        _quiz_panel()
+st.sidebar.write("✨ **Pro version** with visual modules *coming soon!* 🌿💡")
 st.sidebar.markdown("<br><sub>💚 Powered by BiovynAI — Created with love by Gunjan 💚</sub>", unsafe_allow_html=True)
+if st.session_state.get("last_ttft") is not None:
+    st.sidebar.caption(f"⚡ First token in {st.session_state.last_ttft:.2f}s")
+if st.session_state.get("last_prompt_tokens"):
+    st.sidebar.caption(f"🧾 ~{st.session_state.last_prompt_tokens} prompt tokens")
+_cache_stats = get_response_cache().stats()
+st.sidebar.caption(
+    f"🗄️ Answer cache: {_cache_stats['memory_hits'] + _cache_stats['disk_hits']} hits · "
+    f"{_cache_stats['misses']} misses ({_cache_stats['hit_rate']:.0%})"
+)
+_state_icons = {"closed": "🟢", "half-open": "🟡", "open": "🔴"}
+st.sidebar.caption("Backends: " + " · ".join(
+    f"{_state_icons[state]} {name}" for name, state in get_router().snapshot().items()
+))
 
 # ─────────────────────────────
 # 💬 HEADER
@@ -76,32 +183,106 @@ st.markdown("<p style='text-align:center; color:#1a1a1a;'>Ask BiovynAI anything
 # ─────────────────────────────
 # 🌱 SESSION STATE
 # ─────────────────────────────
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+# chat history lives in the shared session store (memory tail + SQLite), keyed by a
+# token kept in the URL so a reload or reconnect picks the conversation back up
+if "session_token" not in st.session_state:
+    token = st.query_params.get("session")
+    if not SessionStore.valid_token(token):
+        token = SessionStore.new_token()
+        st.query_params["session"] = token
+    st.session_state.session_token = token
 if "study_mode" not in st.session_state:
     st.session_state.study_mode = False
 if "loading" not in st.session_state:
     st.session_state.loading = False
 if "clear_input_next_run" not in st.session_state:
     st.session_state.clear_input_next_run = False
+if "last_ttft" not in st.session_state:
+    st.session_state.last_ttft = None
+if "pending_job" not in st.session_state:
+    st.session_state.pending_job = None
+if "chat_context" not in st.session_state:
+    st.session_state.chat_context = new_context()
+if "ollama_context" not in st.session_state:
+    st.session_state.ollama_context = None
+if "last_prompt_tokens" not in st.session_state:
+    st.session_state.last_prompt_tokens = None
+HISTORY_WINDOW = get_setting("HISTORY_WINDOW", 30, int)
+if "history_shown" not in st.session_state:
+    st.session_state.history_shown = HISTORY_WINDOW
 
 if st.session_state.get("clear_input_next_run", False):
     st.session_state["user_input"] = ""
     st.session_state["clear_input_next_run"] = False
+if st.session_state.get("retry_input"):
+    # "Retry" after a busy notice puts the question back into the input
+    st.session_state["user_input"] = st.session_state.pop("retry_input")
 
 # ─────────────────────────────
 # 💬 CHAT DISPLAY
 # ─────────────────────────────
-for msg in st.session_state.messages:
-    if msg["role"] == "user":
-        st.markdown(f"<div class='user-bubble'>{msg['content']}</div>", unsafe_allow_html=True)
-    else:
-        st.markdown(f"<div class='bot-bubble'>{msg['content']}</div>", unsafe_allow_html=True)
+# only the newest `history_shown` messages are drawn, as one markdown element,
+# so a rerun costs the same no matter how long the conversation gets
+_messages = get_session_store().open(st.session_state.session_token)
+_hidden = max(0, len(_messages) - st.session_state.history_shown)
+if _hidden:
+    if st.button(f"⬆️ Load earlier messages ({_hidden} hidden)"):
+        st.session_state.history_shown += HISTORY_WINDOW
+        st.rerun()
+if _messages:
+    st.markdown(
+        "".join(bubble_html(m["role"], m["content"]) for m in _messages[_hidden:]),
+        unsafe_allow_html=True,
+    )
+
+# the in-progress answer is polled from the background worker and streamed here,
+# so this script run (and the user's thread) never blocks on the LLM
+@st.fragment(run_every=0.5)
+def _pending_answer():
+    job = get_job_manager().get(st.session_state.pending_job)
+    if job is None:
+        # job expired or server restarted — don't leave the input locked
+        st.session_state.pending_job = None
+        st.session_state.loading = False
+        st.rerun()
+    if not job.done:
+        # still waiting for a worker: say where we are in line instead of "thinking"
+        position = get_job_manager().position(job)
+        if position is not None:
+            text = f"⏳ Lots of students are asking right now — you're #{position} in line"
+        else:
+            text = job.text or "Thinking... 🧠"
+        st.markdown(f"<div class='bot-bubble'>{text}▌</div>", unsafe_allow_html=True)
+        return
+
+    answer = job.text.strip()
+    if answer:
+        get_session_store().open(st.session_state.session_token).append("assistant", answer)
+    # a failed job never stores an empty bubble; the reason is shown under the input instead
+    error = job.error
+    st.session_state.answer_error = None
+    if isinstance(error, Busy):
+        # no backend slot came free in time: the same busy notice (and Retry) as at submit
+        st.session_state.busy = {"message": str(error), "retry_after": max(1.0, error.retry_after), "question": job.prompt}
+    elif error is not None:
+        st.session_state.answer_error = str(error) or type(error).__name__
+    st.session_state.last_ttft = job.stats.get("ttft")
+    st.session_state.last_prompt_tokens = job.stats.get("prompt_tokens")
+    # Ollama's context only covers the conversation if Ollama answered this turn
+    st.session_state.ollama_context = job.stats.get("ollama_context") if job.stats.get("source") == "ollama" else None
+    st.session_state.pending_job = None
+    st.session_state.loading = False
+    st.rerun()
+
+if st.session_state.pending_job:
+    _pending_answer()
 
 # ─────────────────────────────
 # 🧠 USER INPUT
 # ─────────────────────────────
-with st.container():
+# a fragment: typing and toggling only rerun this block, not the chat history
+@st.fragment
+def _input_area():
     disabled = st.session_state.loading
     user_input = st.text_input(
         "You:",
@@ -115,44 +296,72 @@ with st.container():
         study_mode = st.toggle("🎓 Study Mode", value=st.session_state.study_mode, disabled=disabled)
     with col2:
         clear_chat = st.button("🗑️ Clear Chat", disabled=disabled)
-    with col3:
-        show_diagram_button = False
 
-# ─────────────────────────────
-# 🧠 CHAT LOGIC
-# ─────────────────────────────
-if clear_chat:
-    st.session_state.messages = []
-    st.session_state["user_input"] = ""
-    st.rerun()
+    # ─────────────────────────────
+    # 🧠 CHAT LOGIC
+    # ─────────────────────────────
+    history = get_session_store().open(st.session_state.session_token)
+    if clear_chat:
+        history.clear()
+        st.session_state.chat_context.reset()
+        st.session_state.ollama_context = None
+        st.session_state.history_shown = HISTORY_WINDOW
+        st.session_state.answer_error = None
+        st.session_state["clear_input_next_run"] = True
+        st.rerun()
 
-if user_input and not st.session_state.loading:
-    st.session_state.loading = True
-    st.session_state.study_mode = study_mode
-    st.session_state.messages.append({"role": "user", "content": user_input})
+    if st.session_state.get("answer_error"):
+        st.error(f"⚠️ BiovynAI couldn't finish that answer ({st.session_state.answer_error}). Please ask again.")
 
-    with st.spinner("Thinking... 🧠"):
-        reply = get_biovyn_response(user_input, study_mode)
+    busy = st.session_state.get("busy")
+    if busy:
+        st.warning(f"🚦 {busy['message']} — please retry in about {busy['retry_after']:.0f}s.")
+        if st.button("🔁 Retry"):
+            st.session_state.retry_input = busy["question"]
+            st.session_state.busy = None
+            st.rerun()
 
-    st.session_state.messages.append({"role": "assistant", "content": reply})
-    st.session_state["clear_input_next_run"] = True
-    st.session_state.loading = False
-    st.rerun()
+    if user_input and not st.session_state.loading:
+        st.session_state.study_mode = study_mode
+        # a retried question that never got an answer is already the last message
+        retrying = len(history) > 0 and history[-1]["role"] == "user" and history[-1]["content"] == user_input
+        # earlier turns go along under a token budget (older ones as a rolling summary)
+        context = st.session_state.chat_context.build(history[:-1] if retrying else history, user_input)
+
+        # hand the generation to the shared worker pool; identical in-flight
+        # questions from other sessions are coalesced into one upstream call.
+        # When the queue is full (or this session is asking too fast) we get an
+        # immediate "busy" instead of a long wait.
+        try:
+            job = get_job_manager().submit(
+                user_input, study_mode, context, st.session_state.ollama_context,
+                session=st.session_state.session_token,
+            )
+        except Busy as e:
+            st.session_state.busy = {"message": str(e), "retry_after": max(1.0, e.retry_after), "question": user_input}
+        else:
+            if not retrying:
+                history.append("user", user_input)
+            st.session_state.pending_job = job.id
+            st.session_state.loading = True
+            st.session_state.busy = None
+            st.session_state.answer_error = None
+        st.session_state["clear_input_next_run"] = True
+        # full rerun so the new message shows up in the history above
+        st.rerun()
+
+_input_area()
 
 # ─────────────────────────────
 # 🌿 SMART DIAGRAM BUTTON
 # ─────────────────────────────
-bio_keywords = [
-    "cell", "dna", "rna", "photosynthesis", "mitochondria", "nucleus",
-    "chloroplast", "neuron", "heart", "brain", "respiration", "ecosystem",
-    "enzyme", "protein", "gene", "plant", "virus", "bacteria"
-]
-
-if st.session_state.messages:
-    last_msg = st.session_state.messages[-1]["content"]
-    last_msg_lower = last_msg.lower()
+if _messages:
+    last_msg = _messages[-1]["content"]
 
-    if any(word in last_msg_lower for word in bio_keywords):
+    # one compiled index (topics.json) instead of a substring scan over a keyword list
+    if get_topic_index().mentions(last_msg):
+        if prefetch_diagrams and not st.session_state.pending_job:
+            get_diagram_prefetcher().prefetch(last_msg)
         st.markdown("<br>", unsafe_allow_html=True)
         if st.button("🧠 Show Diagram for Last Topic"):
             diagram = generate_bio_diagram(last_msg)
@@ -165,22 +374,30 @@ if st.session_state.messages:
 
 
 # --- Add export/download chat button (place where you want it in the UI) ---
-def _format_messages_for_export(messages):
-    lines = []
-    for m in messages:
-        role = "You" if m["role"] == "user" else "BiovynAI"
-        lines.append(f"{role}: {m['content']}\n")
-    return "\n".join(lines)
-
-if st.session_state.get("messages"):
-    # Show a small download button to export the current chat
-    chat_text = _format_messages_for_export(st.session_state.messages)
-    st.download_button(
-        label="📥 Download Chat (TXT)",
-        data=chat_text,
-        file_name="biovynai_chat.txt",
-        mime="text/plain"
-    )
+# nothing is written until the user asks for an export; after that each rerun only
+# appends the messages added since to the file on disk (see export.Transcript)
+if _messages:
+    col_fmt, col_dl = st.columns([1, 3])
+    with col_fmt:
+        export_format = st.selectbox(
+            "Export format", list(FORMATS), format_func=lambda f: FORMATS[f][0],
+            key="export_format", label_visibility="collapsed",
+        )
+    transcript = st.session_state.get("transcript")
+    with col_dl:
+        if transcript is None or transcript.fmt != export_format or transcript.token != _messages.token:
+            if st.button(f"📥 Export Chat ({export_format.upper()})"):
+                st.session_state.transcript = Transcript(export_format, _messages.token)
+                st.rerun()
+        else:
+            label, mime, ext = FORMATS[export_format]
+            with open(transcript.update(_messages), "rb") as f:
+                st.download_button(
+                    label=f"📥 Download Chat ({export_format.upper()})",
+                    data=f,
+                    file_name=f"biovynai_chat.{ext}",
+                    mime=mime
+                )
 
 
 
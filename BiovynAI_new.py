@@ -3,18 +3,16 @@
 
 
 import streamlit as st
-import requests
-from openai import OpenAI
-import base64
-import time
+from config import get_setting
+from topics import get_topic_index
+from transport import get_http_session, get_openai_client, timeout
 
 # ─────────────────────────────
 # 🌿 SETUP
 # ─────────────────────────────
 st.set_page_config(page_title="BiovynAI", page_icon="🧬", layout="wide")
 
-client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
-OLLAMA_URL = st.secrets.get("OLLAMA_URL", "http://localhost:11434/api/generate")
+OLLAMA_URL = get_setting("OLLAMA_URL", "http://localhost:11434/api/generate")
 
 # ─────────────────────────────
 # 🌈 CUSTOM STYLING
@@ -106,7 +104,7 @@ if st.session_state.get("clear_input_next_run", False):
 def get_biovyn_response(prompt, study_mode=False):
     """Hybrid AI: First tries Ollama, falls back to OpenAI."""
     try:
-        response = requests.post(OLLAMA_URL, json={"model": "llama3:3b", "prompt": prompt}, timeout=10)
+        response = get_http_session().post(OLLAMA_URL, json={"model": "llama3:3b", "prompt": prompt, "stream": False}, timeout=timeout(10))
         if response.status_code == 200 and "response" in response.json():
             return response.json()["response"].strip()
     except Exception:
@@ -115,7 +113,8 @@ def get_biovyn_response(prompt, study_mode=False):
     if study_mode:
         prompt = f"Explain this in a more educational and structured way: {prompt}"
 
-    response = client.chat.completions.create(
+    # shared, pooled client — built (and openai imported) on first use, not per rerun
+    response = get_openai_client(allow_images=True).chat.completions.create(
         model="gpt-4o-mini",
         messages=[
             {"role": "system", "content": "You are BiovynAI, a biology expert who explains clearly and kindly."},
@@ -129,49 +128,29 @@ def get_biovyn_response(prompt, study_mode=False):
 # ─────────────────────────────
 # 🔬 DIAGRAM GENERATION FUNCTION (with reliable placeholder)
 # ─────────────────────────────
-import io
-from PIL import Image
-
 def generate_bio_diagram(prompt):
     """Generate a biology diagram using OpenAI or show a reliable placeholder."""
     with st.spinner("Generating diagram... 🧬"):
         try:
             image_prompt = f"Detailed labeled biology diagram of {prompt}, educational, colorful, clean layout"
-            result = client.images.generate(
+            result = get_openai_client(allow_images=True).images.generate(
                 model="gpt-image-1",
                 prompt=image_prompt,
                 size="1024x1024"
             )
             image_base64 = result.data[0].b64_json
             if image_base64:
+                import base64
                 image_bytes = base64.b64decode(image_base64)
                 st.image(image_bytes, caption=f"Diagram: {prompt}", use_column_width=True)
                 return
         except Exception as e:
             st.warning(f"Using sample diagram — image generation currently unavailable.\n\n{e}")
 
-        # 📌 Fallback placeholder logic
-        placeholder_map = {
-            "cell": "https://upload.wikimedia.org/wikipedia/commons/3/3f/Animal_cell_structure_en.svg",
-            "dna": "https://upload.wikimedia.org/wikipedia/commons/8/87/DNA_chemical_structure.svg",
-            "photosynthesis": "https://upload.wikimedia.org/wikipedia/commons/3/3e/Photosynthesis_process_diagram_en.svg",
-            "heart": "https://upload.wikimedia.org/wikipedia/commons/5/55/Diagram_of_the_human_heart_%28cropped%29.svg",
-            "brain": "https://upload.wikimedia.org/wikipedia/commons/4/44/Diagram_showing_the_main_parts_of_the_brain_CRUK_188.svg",
-            "neuron": "https://upload.wikimedia.org/wikipedia/commons/b/b5/Neuron.svg",
-            "plant": "https://upload.wikimedia.org/wikipedia/commons/f/f5/Plant_cell_structure-en.svg",
-            "virus": "https://upload.wikimedia.org/wikipedia/commons/7/77/Virus_Structure.svg",
-            "bacteria": "https://upload.wikimedia.org/wikipedia/commons/3/32/Bacterial_cell_structure.svg"
-        }
-
-        # Pick a matching placeholder or default
-        placeholder_url = None
-        for key, url in placeholder_map.items():
-            if key in prompt.lower():
-                placeholder_url = url
-                break
-
-        if not placeholder_url:
-            placeholder_url = "https://upload.wikimedia.org/wikipedia/commons/3/3f/Animal_cell_structure_en.svg"
+        # 📌 Fallback placeholder logic — shared topic index (topics.json)
+        index = get_topic_index()
+        topic = index.best(prompt, require_diagram=True)
+        placeholder_url = (topic or index.topics[index.default_diagram]).diagram
 
         st.image(placeholder_url, caption=f"Example Diagram: {prompt}", use_column_width=True)
 
@@ -231,17 +210,10 @@ if user_input and not st.session_state.loading:
 # ─────────────────────────────
 # 🌿 SMART DIAGRAM SUGGESTION + BUTTON (Improved)
 # ─────────────────────────────
-bio_keywords = [
-    "cell", "dna", "rna", "photosynthesis", "mitochondria", "nucleus",
-    "chloroplast", "neuron", "heart", "brain", "respiration", "ecosystem",
-    "enzyme", "protein", "gene", "plant", "virus", "bacteria"
-]
-
 if st.session_state.messages:
     last_msg = st.session_state.messages[-1]["content"]
-    last_msg_lower = last_msg.lower()
 
-    if any(word in last_msg_lower for word in bio_keywords):
+    if get_topic_index().mentions(last_msg):
         st.markdown("<br>", unsafe_allow_html=True)
         if st.button("🧠 Show Diagram for Last Topic"):
             generate_bio_diagram(last_msg)
@@ -0,0 +1,161 @@
+# batch.py — answer a file of questions from the command line (no Streamlit server needed)
+# usage: python batch.py questions.jsonl --out answers.jsonl [--concurrency 4] [--study] [--config biovyn.toml]
+#
+# Input is JSONL ({"question": ..., "study_mode": true, "id": ...}) or CSV with the same
+# columns; only the question is required. Answers are appended to --out as they finish,
+# one JSON object per line, so an interrupted run picks up where it stopped: rows already
+# answered there are skipped. Every answer also lands in the response cache, so a run
+# before an exam warms it for the app.
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+TRUE_VALUES = ("1", "true", "yes", "on", "y")
+
+
+def _flag(value, default):
+    if value is None or value == "":
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in TRUE_VALUES
+
+
+def read_rows(path, default_study=False):
+    """Yield {"id", "question", "study_mode"} for each usable row of a JSONL or CSV file."""
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.endswith(".csv"):
+            records = csv.DictReader(f)
+        else:
+            records = (json.loads(line) for line in f if line.strip())
+        for record in records:
+            question = (record.get("question") or record.get("prompt") or "").strip()
+            if not question:
+                continue
+            study_mode = _flag(record.get("study_mode", record.get("study")), default_study)
+            row_id = record.get("id") or hashlib.sha1(f"{int(study_mode)}|{question}".encode("utf-8")).hexdigest()[:12]
+            yield {"id": str(row_id), "question": question, "study_mode": study_mode}
+
+
+def finished_ids(path):
+    """Ids already answered in an earlier run's output (errors and offline answers are retried)."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by the interruption
+            if not result.get("error"):
+                done.add(result["id"])
+    return done
+
+
+def answer(row, max_wait=300.0):
+    from backend import stream_biovyn_response
+    from scheduler import Busy
+
+    result = dict(row)
+    deadline = time.monotonic() + max_wait
+    while True:
+        stats = {}
+        try:
+            result["answer"] = "".join(stream_biovyn_response(row["question"], row["study_mode"], stats)).strip()
+            if stats.get("source") == "offline":
+                result["error"] = "no backend available"
+        except Busy as e:
+            # every slot taken (more threads than OLLAMA_CONCURRENCY): nothing was
+            # generated yet, so wait for one rather than record a failure
+            if time.monotonic() < deadline:
+                time.sleep(min(e.retry_after, 2.0))
+                continue
+            result["error"] = f"Busy: {e}"
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+        break
+    result["source"] = stats.get("source")
+    result["ttft"] = round(stats["ttft"], 3) if stats.get("ttft") is not None else None
+    result["total"] = round(stats["total"], 3) if stats.get("total") is not None else None
+    return result
+
+
+def run(rows, out, concurrency=4, progress=None):
+    """
+    Answer `rows` on `concurrency` threads, writing each result to `out` as soon as
+    it is ready. At most 2 x concurrency rows are in flight, so huge files stream.
+    """
+    counts = {"answered": 0, "failed": 0}
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="biovyn-batch") as pool:
+        pending = set()
+
+        def drain():
+            nonlocal pending
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+                counts["failed" if result.get("error") else "answered"] += 1
+                if progress:
+                    progress(result, counts)
+
+        for row in rows:
+            pending.add(pool.submit(answer, row))
+            if len(pending) >= 2 * concurrency:
+                drain()
+        while pending:
+            drain()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Answer a JSONL/CSV file of biology questions with BiovynAI")
+    parser.add_argument("input", help="questions (.jsonl or .csv)")
+    parser.add_argument("--out", default=None, help="results JSONL (default: <input>.answers.jsonl)")
+    parser.add_argument("--concurrency", type=int, default=None, help="parallel questions (default: BATCH_CONCURRENCY or 4)")
+    parser.add_argument("--study", action="store_true", help="study mode for rows that don't say")
+    parser.add_argument("--config", default=None, help="settings file (.toml like secrets.toml, or KEY=VALUE lines)")
+    parser.add_argument("--fresh", action="store_true", help="ignore earlier results in --out and start over")
+    args = parser.parse_args(argv)
+
+    # settings are read when the modules below are imported, so the file goes first
+    if args.config:
+        os.environ["BIOVYN_CONFIG"] = args.config
+    from streamlit.logger import set_log_level
+
+    from config import get_setting
+    import backend  # noqa: F401 — load once here rather than racing on the worker threads
+
+    # after Streamlit has read its own config, which resets the level: no
+    # "missing ScriptRunContext" noise outside `streamlit run`
+    set_log_level("error")
+
+    out_path = args.out or os.path.splitext(args.input)[0] + ".answers.jsonl"
+    concurrency = args.concurrency or get_setting("BATCH_CONCURRENCY", 4, int)
+    skip = set() if args.fresh else finished_ids(out_path)
+    rows = (row for row in read_rows(args.input, args.study) if row["id"] not in skip)
+    if skip:
+        print(f"resuming: {len(skip)} questions already answered in {out_path}", file=sys.stderr)
+
+    start = time.perf_counter()
+
+    def progress(result, counts):
+        status = "FAIL" if result.get("error") else result.get("source")
+        print(f"[{counts['answered'] + counts['failed']}] {status:>14}  {result['question'][:70]}", file=sys.stderr)
+
+    with open(out_path, "w" if args.fresh else "a", encoding="utf-8") as out:
+        counts = run(rows, out, concurrency, progress)
+    elapsed = time.perf_counter() - start
+    print(f"{counts['answered']} answered, {counts['failed']} failed in {elapsed:.1f}s -> {out_path}", file=sys.stderr)
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
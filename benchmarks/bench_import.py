@@ -0,0 +1,73 @@
+# benchmarks/bench_import.py — cold-start import cost of the app's modules
+# usage: python benchmarks/bench_import.py [--module backend] [--top 15] [--budget-ms 0] [--json out.json]
+#
+# Runs `python -X importtime -c "import <module>"` in a fresh interpreter, prints the
+# most expensive imports and checks that heavy optional dependencies are not
+# pulled in at import time (they should load on first use).
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# must not be imported just by importing the app code
+LAZY_MODULES = ["openai", "httpx", "httpx2", "numpy", "PIL", "requests"]
+
+
+def import_profile(module):
+    probe = (
+        f"import sys, json; import {module}; "
+        f"print(json.dumps([m for m in {LAZY_MODULES!r} if m in sys.modules]))"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", probe],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        sys.exit(proc.stderr[-2000:])
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append({"module": name.strip(), "depth": depth, "self_us": int(self_us), "cumulative_us": int(cumulative_us)})
+    return rows, json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--module", default="backend")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=0, help="fail if the total import time exceeds this")
+    parser.add_argument("--json", help="write the full report here")
+    args = parser.parse_args()
+
+    rows, eager = import_profile(args.module)
+    top_level = [r for r in rows if r["depth"] == 0]
+    total_ms = sum(r["cumulative_us"] for r in top_level) / 1000
+
+    print(f"import {args.module}: {total_ms:.1f} ms total, {len(rows)} modules")
+    for r in sorted(rows, key=lambda r: r["cumulative_us"], reverse=True)[: args.top]:
+        print(f"{r['cumulative_us'] / 1000:9.1f} ms  {r['module']}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"module": args.module, "total_ms": total_ms, "eager_heavy": eager, "imports": rows}, f, indent=2)
+
+    failed = False
+    if eager:
+        print(f"FAIL: imported eagerly: {', '.join(eager)}")
+        failed = True
+    if args.budget_ms and total_ms > args.budget_ms:
+        print(f"FAIL: {total_ms:.1f} ms exceeds the {args.budget_ms:.0f} ms budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
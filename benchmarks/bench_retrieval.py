@@ -0,0 +1,103 @@
+# benchmarks/bench_retrieval.py — ingest time, index size and query latency of the notes index
+# usage: python benchmarks/bench_retrieval.py [--files 500] [--notes path/to/notes]
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from retrieval import RetrievalIndex  # noqa: E402
+from topics import TOPICS_FILE  # noqa: E402
+
+QUERIES = [
+    "What is the powerhouse of the cell?",
+    "Explain photosynthesis in a plant cell step by step.",
+    "How does DNA replication work?",
+    "What do neurons do?",
+    "How do viruses infect bacteria?",
+    "Tell me about the history of the printing press.",  # no match
+]
+FILLER = ("the process of energy membrane protein structure function cycle stage layer molecule "
+          "signal transport enzyme pathway tissue organ system gene expression cell division").split()
+
+
+def synthetic_notes(folder, files, seed=0):
+    """`files` Markdown notes of ~6 sections each, built from the topic vocabulary."""
+    rng = random.Random(seed)
+    with open(TOPICS_FILE, encoding="utf-8") as f:
+        terms = [t for topic in json.load(f)["topics"] for t in topic["terms"]]
+    vocabulary = [w for t in terms for w in t.split()] + FILLER
+    for i in range(files):
+        sections = []
+        for _ in range(6):
+            heading = rng.choice(terms).title()
+            paragraphs = [
+                " ".join(rng.choice(vocabulary) for _ in range(rng.randint(12, 25))).capitalize() + "."
+                for _ in range(rng.randint(2, 5))
+            ]
+            sections.append(f"## {heading}\n\n" + "\n\n".join(paragraphs))
+        with open(os.path.join(folder, f"note-{i:05d}.md"), "w", encoding="utf-8") as f:
+            f.write(f"# Note {i}\n\n" + "\n\n".join(sections) + "\n")
+
+
+def index_size(directory):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _dirs, names in os.walk(directory) for name in names)
+
+
+def latencies(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        for query in QUERIES:
+            start = time.perf_counter()
+            fn(query)
+            samples.append(time.perf_counter() - start)
+    samples.sort()
+
+    def pick(q):
+        return samples[min(len(samples) - 1, int(q * len(samples)))] * 1e6
+
+    return f"p50 {pick(0.5):7.1f} µs | p95 {pick(0.95):7.1f} µs | p99 {pick(0.99):7.1f} µs"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=500, help="synthetic notes to generate")
+    parser.add_argument("--notes", default=None, help="index this folder instead of synthetic notes")
+    parser.add_argument("--repeat", type=int, default=300)
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="biovyn-retrieval-")
+    try:
+        notes = args.notes
+        if notes is None:
+            notes = os.path.join(workdir, "notes")
+            os.makedirs(notes)
+            synthetic_notes(notes, args.files)
+        index_dir = os.path.join(workdir, "index")
+        os.makedirs(index_dir)
+
+        index = RetrievalIndex(index_dir)
+        start = time.perf_counter()
+        counts = index.ingest(notes)
+        print(f"full ingest:        {time.perf_counter() - start:7.2f} s  ({counts['changed']} files, {counts['passages']} passages)")
+        start = time.perf_counter()
+        index.ingest(notes)
+        print(f"unchanged re-scan:  {time.perf_counter() - start:7.3f} s")
+        if args.notes is None:
+            with open(os.path.join(notes, "note-00000.md"), "a", encoding="utf-8") as f:
+                f.write("\n## Extra\n\nMitochondria make ATP through cellular respiration.\n")
+            start = time.perf_counter()
+            counts = index.ingest(notes)
+            print(f"one file changed:   {time.perf_counter() - start:7.3f} s  ({counts['changed']} re-read)")
+        print(f"index size:         {index_size(index_dir) / 1024:7.1f} KB  (postings + sqlite with passage text)")
+
+        print(f"scoring only  (k={args.k}): {latencies(lambda q: index.top_ids(q, args.k), args.repeat)}")
+        print(f"with passages (k={args.k}): {latencies(lambda q: index.search(q, args.k), args.repeat)}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,52 @@
+# benchmarks/bench_topics.py — microbenchmark for topic lookups
+# usage: python benchmarks/bench_topics.py [--topics 5000]
+import argparse
+import os
+import random
+import string
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from topics import TOPICS_FILE, Topic, TopicIndex  # noqa: E402
+
+SAMPLES = [
+    "What is the powerhouse of the cell and why do mitochondria have their own DNA?",
+    "Explain photosynthesis in a plant cell step by step.",
+    "How do viruses differ from bacteria?",
+    "Tell me about the history of the printing press.",  # no topic
+    "Describe cellular respiration, glycolysis and the Krebs cycle in detail for my exam. " * 5,
+]
+
+
+def synthetic_index(n, seed=0):
+    """The real topics plus `n` random multi-synonym topics."""
+    rng = random.Random(seed)
+    base = TopicIndex.from_file(TOPICS_FILE)
+    topics = list(base.topics.values())
+    for i in range(n):
+        terms = [
+            " ".join("".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10))) for _ in range(rng.randint(1, 3)))
+            for _ in range(3)
+        ]
+        topics.append(Topic(f"synthetic-{i}", terms))
+    return TopicIndex(topics, base.default_diagram)
+
+
+def run(index, label, number):
+    for text in SAMPLES:
+        per_call = min(timeit.repeat(lambda: index.best(text), number=number, repeat=5)) / number
+        print(f"{label:>18} | {len(text):5d} chars | {per_call * 1e6:8.2f} µs  -> {index.best(text)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--topics", type=int, default=5000, help="synthetic topics to add")
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    build = min(timeit.repeat(lambda: synthetic_index(args.topics), number=1, repeat=3))
+    print(f"build time for {args.topics} extra topics: {build * 1000:.1f} ms")
+    run(TopicIndex.from_file(TOPICS_FILE), "real topics", args.number)
+    run(synthetic_index(args.topics), f"+{args.topics} topics", args.number)
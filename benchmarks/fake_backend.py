@@ -0,0 +1,201 @@
+# benchmarks/fake_backend.py — local stand-in for Ollama and the OpenAI chat API
+# usage: python benchmarks/fake_backend.py --port 11999 --latency 0.4 --token-delay 0.02
+#
+# Ollama:  POST /api/generate (NDJSON stream or single JSON), POST /api/embed, GET /api/tags
+# OpenAI:  POST /v1/chat/completions (SSE stream or single JSON)
+# Control: POST /_control with any of {"latency", "token_delay", "tokens", "error_rate", "outage"}
+#          to change behaviour mid-run (e.g. simulate an Ollama outage); GET /_stats for counters.
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("cells mitochondria produce energy through respiration while chloroplasts capture light "
+         "and the nucleus stores genetic information in dna").split()
+
+
+class FakeState:
+    def __init__(self, latency=0.3, token_delay=0.02, tokens=60, error_rate=0.0, outage=False):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.tokens = tokens
+        self.error_rate = error_rate
+        self.outage = outage  # "ollama", "openai", "all" or False
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def down(self, backend):
+        return self.outage in (backend, "all", True)
+
+    def fails(self):
+        return random.random() < self.error_rate
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _json_body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def _send_json(self, payload, status=200):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _start_stream(self, content_type):
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+        def _chunk(self, data):
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        def _end_stream(self):
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+
+        def _outage(self):
+            # behave like a dead host: drop the connection without a response
+            self.close_connection = True
+            try:
+                self.connection.shutdown(2)
+            except OSError:
+                pass
+
+        def _words(self, prompt):
+            rng = random.Random(prompt)
+            return [rng.choice(WORDS) + " " for _ in range(state.tokens)]
+
+        def do_GET(self):
+            if self.path == "/api/tags":
+                state.count("tags")
+                if state.down("ollama"):
+                    return self._outage()
+                return self._send_json({"models": [{"name": "llama3:3b"}, {"name": "llava:latest"}]})
+            if self.path == "/_stats":
+                return self._send_json(state.counts)
+            self._send_json({"error": "not found"}, 404)
+
+        def do_POST(self):
+            body = self._json_body()
+            if self.path == "/_control":
+                for key, value in body.items():
+                    setattr(state, key, value)
+                return self._send_json(vars_of(state))
+            if self.path == "/api/generate":
+                return self._generate(body)
+            if self.path == "/api/embed":
+                return self._embed(body)
+            if self.path in ("/v1/chat/completions", "/chat/completions"):
+                return self._chat(body)
+            self._send_json({"error": "not found"}, 404)
+
+        def _generate(self, body):
+            state.count("generate")
+            if state.down("ollama"):
+                return self._outage()
+            if not body.get("prompt"):
+                # model preload / keep-alive ping
+                return self._send_json({"model": body.get("model"), "response": "", "done": True})
+            time.sleep(state.latency)
+            if state.fails():
+                return self._send_json({"error": "model runner crashed"}, 500)
+            words = self._words(body["prompt"])
+            context = list(body.get("context") or []) + list(range(len(words)))
+            if body.get("stream", True) is False:
+                time.sleep(state.token_delay * len(words))
+                return self._send_json({"response": "".join(words), "done": True, "context": context})
+            self._start_stream("application/x-ndjson")
+            for word in words:
+                self._chunk(json.dumps({"response": word, "done": False}).encode() + b"\n")
+                time.sleep(state.token_delay)
+            self._chunk(json.dumps({"response": "", "done": True, "context": context}).encode() + b"\n")
+            self._end_stream()
+
+        def _embed(self, body):
+            state.count("embed")
+            if state.down("ollama"):
+                return self._outage()
+            inputs = body.get("input") or []
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            vectors = []
+            for text in inputs:
+                digest = hashlib.sha256(text.lower().encode()).digest()
+                vectors.append([(b - 128) / 128 for b in digest * 2])
+            self._send_json({"embeddings": vectors})
+
+        def _chat(self, body):
+            state.count("chat")
+            if state.down("openai"):
+                return self._outage()
+            time.sleep(state.latency)
+            if state.fails():
+                return self._send_json({"error": {"message": "overloaded"}}, 503)
+            words = self._words(body["messages"][-1]["content"])
+            base = {"id": "chatcmpl-fake", "created": int(time.time()), "model": body.get("model", "fake")}
+            if not body.get("stream"):
+                time.sleep(state.token_delay * len(words))
+                return self._send_json({
+                    **base, "object": "chat.completion",
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": "".join(words)}}],
+                })
+            self._start_stream("text/event-stream")
+            for word in words:
+                event = {**base, "object": "chat.completion.chunk",
+                         "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}]}
+                self._chunk(f"data: {json.dumps(event)}\n\n".encode())
+                time.sleep(state.token_delay)
+            self._chunk(b"data: [DONE]\n\n")
+            self._end_stream()
+
+    return Handler
+
+
+def vars_of(state):
+    return {k: v for k, v in vars(state).items() if k not in ("lock",)}
+
+
+def serve(port=11999, **options):
+    """Start the fake server on a daemon thread; returns (server, state)."""
+    state = FakeState(**options)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-backend", daemon=True).start()
+    return server, state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Ollama + OpenAI server for load tests")
+    parser.add_argument("--port", type=int, default=11999)
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="seconds between tokens")
+    parser.add_argument("--tokens", type=int, default=60)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--outage", choices=["ollama", "openai", "all"], default=None)
+    args = parser.parse_args()
+    server, _ = serve(args.port, latency=args.latency, token_delay=args.token_delay, tokens=args.tokens,
+                      error_rate=args.error_rate, outage=args.outage or False)
+    print(f"fake backend on http://127.0.0.1:{args.port} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
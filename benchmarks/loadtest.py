@@ -0,0 +1,290 @@
+# benchmarks/loadtest.py — simulate many concurrent Streamlit sessions against fake backends
+# usage: python benchmarks/loadtest.py --sessions 20 --turns 3 [--outage-after 5] [--compare old.json]
+#
+# Starts benchmarks/fake_backend.py in-process, points the app at it through env
+# settings, then drives N sessions of BiovynAI_app.py with streamlit.testing's
+# AppTest: chat turns (optionally in study mode), a diagram click and a clear-chat.
+# Turns the app turns away as busy are counted as rejected, not completed.
+# All sessions live in one process, like one Streamlit server, and AppTest isn't
+# thread-safe, so a single loop submits every session's question and then polls
+# the sessions waiting on an answer in turn. Latency is therefore only as fine as
+# one sweep over the waiting sessions (about --poll, more with many sessions).
+# Writes p50/p95/p99 latency, time-to-first-token, throughput and memory per
+# session to JSON so runs can be compared.
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+QUESTIONS = [
+    "What is mitochondria?",
+    "Explain photosynthesis",
+    "How does DNA replication work?",
+    "What do neurons do?",
+    "Why do plant cells have a cell wall?",
+    "How do viruses infect bacteria?",
+]
+
+
+def percentiles(values):
+    if not values:
+        return {"n": 0}
+    values = sorted(values)
+
+    def pick(q):
+        return round(values[min(len(values) - 1, int(q * len(values)))], 4)
+
+    return {"n": len(values), "p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": round(values[-1], 4)}
+
+
+def rss_kb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _button(at, prefix):
+    for button in at.button:
+        if button.label.startswith(prefix):
+            return button
+    return None
+
+
+class Session:
+    """One simulated user: an AppTest plus where it is in its turns."""
+
+    def __init__(self, index, args):
+        from streamlit.testing.v1 import AppTest
+
+        self.index, self.args = index, args
+        self.at = AppTest.from_file(os.path.join(ROOT, args.app), default_timeout=args.timeout)
+        self.turn, self.started = 0, None
+        self.result = {"session": index, "turns": [], "rejected": [], "diagram": None, "errors": [], "start": None, "end": None}
+
+    def load(self):
+        self.at.run()
+        if self.args.study and self.index % 2:
+            self.at.toggle[0].set_value(True).run()
+
+    def question(self):
+        if self.args.shared:
+            return QUESTIONS[(self.index + self.turn) % len(QUESTIONS)]
+        return f"{QUESTIONS[self.turn % len(QUESTIONS)]} (#{self.index})"
+
+    def submit(self):
+        """Ask the next question; returns False once every turn is done."""
+        while self.turn < self.args.turns:
+            if self.result["start"] is None:
+                self.result["start"] = time.time()
+            self.started = time.perf_counter()
+            self.at.text_input(key="user_input").input(self.question()).run()
+            self._collect_exceptions()
+            busy = self.at.session_state["busy"] if "busy" in self.at.session_state else None
+            if not busy:
+                return True
+            # turned away by admission control (rate limit or full queue): not a completed turn
+            self.result["rejected"].append({"turn": self.turn, "message": busy["message"], "retry_after": busy["retry_after"]})
+            self.turn += 1
+        self.result["end"] = time.time()
+        return False
+
+    def poll(self):
+        """Rerun like the fragment would; returns False once the current answer is in (or timed out)."""
+        self.at.run()
+        elapsed = time.perf_counter() - self.started
+        if self.at.session_state["pending_job"]:
+            if elapsed < self.args.timeout:
+                return True
+            self.result["errors"].append(f"turn {self.turn}: timed out")
+        else:
+            self.result["turns"].append({"latency": elapsed, "ttft": self.at.session_state["last_ttft"]})
+            self._collect_exceptions()
+        self.turn += 1
+        return False
+
+    def finish(self):
+        button = _button(self.at, "🧠 Show Diagram")
+        if self.args.diagram and button is not None:
+            start = time.perf_counter()
+            button.click().run()
+            self.result["diagram"] = time.perf_counter() - start
+        clear = _button(self.at, "🗑️ Clear Chat")
+        if clear is not None:
+            clear.click().run()
+
+    def _collect_exceptions(self):
+        self.result["errors"].extend(str(e.value) for e in self.at.exception)
+
+
+def drive_sessions(args, env, results):
+    """Drive every session from one thread of one process, like one server; puts the result dicts on `results`."""
+    # settings are read at import time, so set them before the app modules load
+    os.environ.update(env)
+    sessions = [Session(i, args) for i in range(args.sessions)]
+    sessions[0].load()
+    rss_before = rss_kb()  # after the app's modules are imported, which every session shares
+    for session in sessions[1:]:
+        session.load()
+    # AppTest isn't thread-safe, so instead of a thread per user one loop submits for
+    # every session and then polls the ones waiting on an answer in turn
+    waiting = [s for s in sessions if s.submit()]
+    while waiting:
+        sweep = time.perf_counter()
+        waiting = [s for s in waiting if s.poll() or s.submit()]
+        time.sleep(max(0.0, args.poll - (time.perf_counter() - sweep)))
+    for session in sessions:
+        session.finish()
+    rss = (rss_kb() - rss_before) / max(1, len(sessions) - 1)
+    for session in sessions:
+        session.result["rss_kb"] = rss
+        results.put(session.result)
+
+
+def set_outage(port, value):
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{port}/_control", json.dumps({"outage": value}).encode(),
+        {"Content-Type": "application/json"},
+    )
+    urllib.request.urlopen(request).read()
+
+
+def compare(current, previous_path):
+    with open(previous_path) as f:
+        previous = json.load(f)
+    print(f"\ncompared with {previous_path}:")
+    for metric in ("latency", "ttft", "diagram"):
+        for q in ("p50", "p95", "p99"):
+            old, new = previous[metric].get(q), current[metric].get(q)
+            if old and new:
+                print(f"  {metric:8} {q}: {old:8.3f}s -> {new:8.3f}s ({(new - old) / old:+.0%})")
+    old, new = previous["throughput_turns_per_s"], current["throughput_turns_per_s"]
+    print(f"  rejected turns: {previous.get('turns_rejected', 0)} -> {current['turns_rejected']}")
+    if old:
+        print(f"  throughput: {old:.2f} -> {new:.2f} turns/s ({(new - old) / old:+.0%})")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="BiovynAI load test with fake backends")
+    parser.add_argument("--app", default="BiovynAI_app.py")
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--shared", action="store_true", help="sessions ask the same questions (exercises caching/coalescing)")
+    parser.add_argument("--study", action="store_true", help="every other session uses study mode")
+    parser.add_argument("--no-diagram", dest="diagram", action="store_false")
+    parser.add_argument("--port", type=int, default=11999)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--tokens", type=int, default=60)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--outage-after", type=float, default=None, help="take fake Ollama down after N seconds")
+    parser.add_argument("--no-cache", action="store_true", help="disable the response cache")
+    parser.add_argument("--rate-per-minute", type=float, default=None, help="SESSION_RATE_PER_MINUTE for the app")
+    parser.add_argument("--burst", type=int, default=None, help="SESSION_BURST for the app")
+    parser.add_argument("--queue-max", type=int, default=None, help="QUEUE_MAX for the app")
+    parser.add_argument("--poll", type=float, default=0.1)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--compare", default=None, help="previous results JSON to diff against")
+    return parser
+
+
+def run(args):
+    """Run the load test described by `args` and return the report dict."""
+    import fake_backend
+
+    server, state = fake_backend.serve(args.port, latency=args.latency, token_delay=args.token_delay,
+                                       tokens=args.tokens, error_rate=args.error_rate)
+    port = server.server_address[1]  # --port 0 picks a free one
+    env = {
+        "OLLAMA_URL": f"http://127.0.0.1:{port}/api/generate",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{port}/v1",
+        "OPENAI_API_KEY": "fake-key",
+        "BIOVYN_DATA_DIR": tempfile.mkdtemp(prefix="biovyn-loadtest-"),
+        "CACHE_ENABLED": "0" if args.no_cache else "1",
+    }
+    for name, value in (("SESSION_RATE_PER_MINUTE", args.rate_per_minute), ("SESSION_BURST", args.burst),
+                        ("QUEUE_MAX", args.queue_max)):
+        if value is not None:
+            env[name] = str(value)
+
+    if args.outage_after is not None:
+        threading.Timer(args.outage_after, set_outage, (port, "ollama")).start()
+
+    # one process for all the sessions (spawn, not fork: this one runs the fake server's threads)
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    process = ctx.Process(target=drive_sessions, args=(args, env, results), daemon=True)
+    process.start()
+    collected = []
+    # generous: app start-up, every turn timing out, then the diagram and clear-chat runs
+    deadline = time.monotonic() + args.timeout * (args.turns + 4)
+    while len(collected) < args.sessions:
+        try:
+            collected.append(results.get(timeout=max(0.1, min(1.0, deadline - time.monotonic()))))
+        except queue.Empty:
+            if time.monotonic() > deadline or not process.is_alive():
+                break
+    process.join(timeout=5)
+    if process.is_alive():
+        process.terminate()
+    server.shutdown()
+
+    results = sorted(collected, key=lambda r: r["session"])
+    missing = args.sessions - len(results)
+    starts = [r["start"] for r in results if r["start"]]
+    ends = [r["end"] for r in results if r["end"]]
+    wall = max(ends) - min(starts) if starts and ends else 0.0
+    rss = results[0]["rss_kb"] if results else 0
+    turns = [t for r in results for t in r["turns"]]
+    rejected = [t for r in results for t in r["rejected"]]
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "wall_seconds": round(wall, 3),
+        "turns_completed": len(turns),
+        "turns_rejected": len(rejected),
+        "rejected_by": {m: sum(1 for t in rejected if t["message"] == m) for m in sorted({t["message"] for t in rejected})},
+        "throughput_turns_per_s": round(len(turns) / wall, 3) if wall else 0,
+        "latency": percentiles([t["latency"] for t in turns]),
+        "ttft": percentiles([t["ttft"] for t in turns if t["ttft"] is not None]),
+        "diagram": percentiles([r["diagram"] for r in results if r["diagram"] is not None]),
+        "rss_kb_per_session": round(rss, 1),
+        "upstream_calls": dict(state.counts),
+        "errors": [e for r in results for e in r["errors"]] + ["session finished without a result"] * missing,
+    }
+    return report
+
+
+def main():
+    args = build_parser().parse_args()
+    report = run(args)
+    print(json.dumps({k: v for k, v in report.items() if k not in ("config", "errors")}, indent=2))
+    if report["errors"]:
+        print(f"{len(report['errors'])} errors, first: {report['errors'][0]}")
+
+    out = args.out or os.path.join(ROOT, "benchmarks", "results", f"loadtest-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"saved {out}")
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
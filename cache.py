@@ -0,0 +1,145 @@
+# cache.py — two-tier (memory LRU + SQLite) cache for chat answers
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import streamlit as st
+
+from config import data_path, get_setting
+
+
+def normalize_prompt(prompt):
+    """Lowercase, collapse whitespace and drop trailing punctuation so trivial variants share a key."""
+    text = re.sub(r"\s+", " ", prompt.strip().lower())
+    return text.rstrip(" ?!.")
+
+
+def make_key(prompt, study_mode, model):
+    raw = f"{model}\x1f{int(bool(study_mode))}\x1f{normalize_prompt(prompt)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    In-memory LRU in front of a SQLite table that survives restarts.
+    Entries expire after `ttl` seconds; each tier is capped by entry count and
+    evicts least-recently-used entries first. Memory hits are written back to the
+    disk tier's access times in batches (every `touch_interval` seconds, and before
+    each eviction), so popular answers aren't the first to go. Safe to share
+    between threads.
+    """
+
+    def __init__(self, path, max_memory=256, max_disk=5000, ttl=7 * 24 * 3600, touch_interval=30.0):
+        self.max_memory = max_memory
+        self.max_disk = max_disk
+        self.ttl = ttl
+        self.touch_interval = touch_interval
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+        self._memory = OrderedDict()  # key -> (created, answer)
+        self._touched = {}  # key -> last memory hit not yet written to disk
+        self._flushed = time.time()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, answer TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._db.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and now - entry[0] < self.ttl:
+                self._memory.move_to_end(key)
+                self.hits["memory"] += 1
+                self._touched[key] = now
+                if now - self._flushed >= self.touch_interval:
+                    self._flush_touches(now)
+                    self._db.commit()
+                return entry[1]
+            if entry:
+                del self._memory[key]
+
+            row = self._db.execute("SELECT answer, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] < self.ttl:
+                self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                self._db.commit()
+                self._remember(key, row[1], row[0])
+                self.hits["disk"] += 1
+                return row[0]
+            if row:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+            self.misses += 1
+            return None
+
+    def set(self, key, answer):
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, answer)
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, answer, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, answer, now, now),
+            )
+            # size-based eviction: expired rows first, then least recently used beyond the cap
+            self._flush_touches(now)
+            self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_disk,),
+            )
+            self._db.commit()
+
+    def _flush_touches(self, now):
+        if self._touched:
+            self._db.executemany(
+                "UPDATE responses SET accessed = MAX(accessed, ?) WHERE key = ?",
+                [(accessed, key) for key, accessed in self._touched.items()],
+            )
+            self._touched.clear()
+        self._flushed = now
+
+    def _remember(self, key, created, answer):
+        self._memory[key] = (created, answer)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory:
+            self._memory.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            hits = self.hits["memory"] + self.hits["disk"]
+            total = hits + self.misses
+            return {
+                "memory_hits": self.hits["memory"],
+                "disk_hits": self.hits["disk"],
+                "misses": self.misses,
+                "hit_rate": hits / total if total else 0.0,
+                "memory_entries": len(self._memory),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._touched.clear()
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+
+
+@st.cache_resource
+def get_response_cache():
+    """Process-wide cache shared by every Streamlit session."""
+    return ResponseCache(
+        data_path("responses.sqlite3"),
+        max_memory=get_setting("CACHE_MEMORY_ENTRIES", 256, int),
+        max_disk=get_setting("CACHE_DISK_ENTRIES", 5000, int),
+        ttl=get_setting("CACHE_TTL_SECONDS", 7 * 24 * 3600, float),
+        touch_interval=get_setting("CACHE_TOUCH_SECONDS", 30.0, float),
+    )
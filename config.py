@@ -0,0 +1,65 @@
+# config.py — one place to read settings for both entry points
+import os
+import streamlit as st
+
+_secrets = None
+
+
+def _read_config_file(path):
+    """Settings from a TOML file (same layout as secrets.toml) or KEY=VALUE lines (.env style)."""
+    if path.endswith(".toml"):
+        import tomllib
+
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    settings = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#") and "=" in line:
+                key, value = line.split("=", 1)
+                settings[key.strip()] = value.strip().strip("'\"")
+    return settings
+
+
+def _load_secrets():
+    """
+    st.secrets as a plain dict, parsed once per process ({} without a secrets.toml).
+    A file named by BIOVYN_CONFIG is layered on top, for headless runs (batch.py).
+    """
+    global _secrets
+    if _secrets is None:
+        try:
+            _secrets = st.secrets.to_dict()
+        except Exception:
+            # no secrets.toml (e.g. running outside `streamlit run`) — that's fine
+            _secrets = {}
+        if os.environ.get("BIOVYN_CONFIG"):
+            _secrets.update(_read_config_file(os.environ["BIOVYN_CONFIG"]))
+    return _secrets
+
+
+def get_setting(name, default=None, cast=None):
+    """
+    Read a setting from st.secrets (or the BIOVYN_CONFIG file), then from the environment,
+    then fall back to `default`.
+    `cast` converts the raw value (e.g. int, float, bool); bools accept 1/true/yes/on.
+    """
+    value = _load_secrets().get(name)
+    if value is None:
+        value = os.environ.get(name)
+    if value is None:
+        return default
+    if cast is bool and isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return cast(value) if cast else value
+
+
+DATA_DIR = get_setting("BIOVYN_DATA_DIR", ".biovyn")
+
+
+def data_path(*parts):
+    """Path inside the app's data directory (caches, indexes, logs); parent dirs are created."""
+    path = os.path.join(DATA_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
@@ -0,0 +1,125 @@
+# context.py — token-budgeted multi-turn context with a rolling summary
+import hashlib
+import re
+
+from config import get_setting
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for English); no tokenizer dependency."""
+    return max(1, len(text) // 4)
+
+
+def _first_sentence(text, limit):
+    text = re.sub(r"\s+", " ", text).strip()
+    match = re.match(r"(.+?[.!?])(\s|$)", text)
+    sentence = match.group(1) if match else text
+    return sentence if len(sentence) <= limit else sentence[: limit - 1] + "…"
+
+
+class ContextWindow:
+    """What actually goes to the model for one request."""
+
+    __slots__ = ("summary", "recent", "prompt", "prompt_tokens")
+
+    def __init__(self, summary, recent, prompt, prompt_tokens):
+        self.summary = summary
+        self.recent = recent
+        self.prompt = prompt
+        self.prompt_tokens = prompt_tokens
+
+    @property
+    def empty(self):
+        return not self.summary and not self.recent
+
+    def digest(self):
+        """Stable fingerprint of the prior context, for cache / coalescing keys."""
+        if self.empty:
+            return ""
+        raw = self.summary + "\x1e" + "\x1e".join(f"{m['role']}:{m['content']}" for m in self.recent)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+    def openai_messages(self, system_prompt, user_content):
+        messages = [{"role": "system", "content": system_prompt}]
+        if self.summary:
+            messages.append({"role": "system", "content": f"Earlier in this conversation:\n{self.summary}"})
+        messages.extend({"role": m["role"], "content": m["content"]} for m in self.recent)
+        messages.append({"role": "user", "content": user_content})
+        return messages
+
+    def ollama_prompt(self):
+        if self.empty:
+            return self.prompt
+        parts = []
+        if self.summary:
+            parts.append(f"Earlier in this conversation:\n{self.summary}\n")
+        for m in self.recent:
+            parts.append(f"{'Student' if m['role'] == 'user' else 'BiovynAI'}: {m['content']}")
+        parts.append(f"Student: {self.prompt}\nBiovynAI:")
+        return "\n".join(parts)
+
+
+class RollingContext:
+    """
+    Per-session context builder. The newest turns are sent verbatim; turns that no
+    longer fit the token budget are folded, once each, into a rolling summary of
+    one line per message (the question, or the first sentence of the answer).
+    Folding is incremental — the summary is appended to, never regenerated — and
+    its oldest lines are dropped when it outgrows `summary_budget`.
+    """
+
+    def __init__(self, budget=1500, recent_messages=6, summary_budget=300, system_tokens=40):
+        self.budget = budget
+        self.recent_messages = recent_messages
+        self.summary_budget = summary_budget
+        self.system_tokens = system_tokens
+        self.summary_lines = []
+        self.folded = 0  # number of history messages already in the summary
+
+    def reset(self):
+        self.summary_lines = []
+        self.folded = 0
+
+    def _fold(self, message):
+        if message["role"] == "user":
+            line = f"- Student asked: {_first_sentence(message['content'], 120)}"
+        else:
+            line = f"- BiovynAI: {_first_sentence(message['content'], 160)}"
+        self.summary_lines.append(line)
+        while len(self.summary_lines) > 1 and estimate_tokens("\n".join(self.summary_lines)) > self.summary_budget:
+            self.summary_lines.pop(0)
+
+    def build(self, history, prompt):
+        """ContextWindow for `prompt`, given the prior `history` (list of message dicts)."""
+        if self.folded > len(history):
+            # chat was cleared or replaced
+            self.reset()
+
+        cutoff = max(self.folded, len(history) - self.recent_messages)
+        for message in history[self.folded:cutoff]:
+            self._fold(message)
+        self.folded = cutoff
+
+        def total(recent):
+            return (
+                self.system_tokens
+                + estimate_tokens("\n".join(self.summary_lines))
+                + sum(estimate_tokens(m["content"]) for m in recent)
+                + estimate_tokens(prompt)
+            )
+
+        recent = history[cutoff:]
+        while recent and total(recent) > self.budget:
+            self._fold(recent[0])
+            recent = recent[1:]
+            self.folded += 1
+
+        return ContextWindow("\n".join(self.summary_lines), list(recent), prompt, total(recent))
+
+
+def new_context():
+    return RollingContext(
+        budget=get_setting("CONTEXT_TOKEN_BUDGET", 1500, int),
+        recent_messages=get_setting("CONTEXT_RECENT_MESSAGES", 6, int),
+        summary_budget=get_setting("CONTEXT_SUMMARY_TOKENS", 300, int),
+    )
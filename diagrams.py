@@ -0,0 +1,365 @@
+# diagrams.py — content-addressed store for biology diagrams
+import base64
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import streamlit as st
+
+from cache import normalize_prompt
+from config import data_path, get_setting
+from metrics import get_metrics
+from residency import get_model_residency
+from router import get_router
+from scheduler import Busy, get_backend_limiter
+from topics import get_topic_index
+from transport import get_http_session, timeout
+
+OLLAMA_URL = get_setting("OLLAMA_URL", "http://localhost:11434/api/generate")
+DIAGRAM_MODEL = get_setting("DIAGRAM_MODEL", "llava:latest")
+# someone is waiting on a diagram click, so give up quickly; prefetches run in the
+# background and can afford to wait for a slow llava
+LLAVA_TIMEOUT = get_setting("LLAVA_TIMEOUT", 12.0, float)
+LLAVA_PREFETCH_TIMEOUT = get_setting("LLAVA_PREFETCH_TIMEOUT", 60.0, float)
+MAX_SIDE = get_setting("DIAGRAM_MAX_SIDE", 1024, int)
+
+
+def diagram_topic(prompt):
+    """Id of the most specific known topic in `prompt` that has a placeholder diagram, or None."""
+    topic = get_topic_index().best(prompt, require_diagram=True)
+    return topic.id if topic else None
+
+
+def placeholder_url(topic_id):
+    """Trusted placeholder (no network to OpenAI) for a topic id."""
+    return get_topic_index().topics[topic_id].diagram
+
+
+def placeholder_key(topic_id):
+    """Store key of a topic's placeholder; kept apart from the topic's own (llava) key."""
+    return f"placeholder:{topic_id}"
+
+
+def thumbnail_url(svg_url, width=MAX_SIDE):
+    """
+    Wikimedia's own PNG rendering of an SVG. PIL can't rasterize SVG, so we fetch this
+    once and re-encode it locally instead of shipping the SVG to every browser.
+    """
+    prefix = "/wikipedia/commons/"
+    head, _, path = svg_url.partition(prefix)
+    name = path.rsplit("/", 1)[-1]
+    return f"{head}{prefix}thumb/{path}/{width}px-{name}.png"
+
+
+def _encode(image_bytes, max_side=MAX_SIDE):
+    """Downscale to `max_side` and re-encode as WebP (PNG if this Pillow has no WebP)."""
+    from PIL import Image, features
+
+    img = Image.open(io.BytesIO(image_bytes))
+    img.thumbnail((max_side, max_side))
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA")
+    out = io.BytesIO()
+    if features.check("webp"):
+        img.save(out, format="WEBP", quality=85, method=4)
+        return out.getvalue(), "webp"
+    img.save(out, format="PNG", optimize=True)
+    return out.getvalue(), "png"
+
+
+class DiagramStore:
+    """
+    Topic -> image index over content-addressed files (`<sha256>.<ext>`), so identical
+    images are stored once. Total size is capped; least recently used topics are
+    evicted first and a blob is deleted once no topic points at it.
+    """
+
+    def __init__(self, directory, max_bytes=200 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, "index.sqlite3"), check_same_thread=False, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS diagrams ("
+            " topic TEXT PRIMARY KEY, digest TEXT NOT NULL, ext TEXT NOT NULL, source TEXT NOT NULL,"
+            " size INTEGER NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def _blob_path(self, digest, ext):
+        return os.path.join(self.directory, f"{digest}.{ext}")
+
+    def get(self, topic, source=None):
+        """Image bytes stored for `topic` (only if it came from `source`, when given), or None."""
+        with self._lock:
+            row = self._db.execute("SELECT digest, ext, source FROM diagrams WHERE topic = ?", (topic,)).fetchone()
+            if row is None or (source is not None and row[2] != source):
+                return None
+            row = row[:2]
+            try:
+                with open(self._blob_path(*row), "rb") as f:
+                    data = f.read()
+            except OSError:
+                self._db.execute("DELETE FROM diagrams WHERE topic = ?", (topic,))
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE diagrams SET accessed = ? WHERE topic = ?", (time.time(), topic))
+            self._db.commit()
+            return data
+
+    def put(self, topic, image_bytes, source):
+        """Re-encode, store content-addressed and point `topic` at it; returns the stored bytes."""
+        data, ext = _encode(image_bytes)
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            path = self._blob_path(digest, ext)
+            if not os.path.exists(path):
+                tmp = f"{path}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+            self._db.execute(
+                "INSERT OR REPLACE INTO diagrams (topic, digest, ext, source, size, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (topic, digest, ext, source, len(data), time.time()),
+            )
+            self._evict()
+            self._db.commit()
+        return data
+
+    def _evict(self):
+        rows = self._db.execute("SELECT topic, digest, ext, size FROM diagrams ORDER BY accessed DESC").fetchall()
+        kept, total = set(), 0
+        for topic, digest, ext, size in rows:
+            if digest in kept:
+                continue
+            if total + size <= self.max_bytes:
+                kept.add(digest)
+                total += size
+            else:
+                self._db.execute("DELETE FROM diagrams WHERE topic = ?", (topic,))
+        live = {row[0] for row in self._db.execute("SELECT DISTINCT digest FROM diagrams")}
+        for name in os.listdir(self.directory):
+            digest, _, ext = name.partition(".")
+            if ext in ("webp", "png") and digest not in live:
+                os.remove(os.path.join(self.directory, name))
+
+    def fetch_placeholder(self, topic):
+        """Download the placeholder for `topic` once, pre-rendered, and store it under `placeholder_key`."""
+        url = thumbnail_url(placeholder_url(topic))
+        # Wikimedia rejects requests without a descriptive User-Agent
+        resp = get_http_session().get(url, headers={"User-Agent": "BiovynAI/1.0 (diagram cache)"}, timeout=timeout(15))
+        resp.raise_for_status()
+        return self.put(placeholder_key(topic), resp.content, "placeholder")
+
+
+@st.cache_resource
+def get_diagram_store():
+    directory = os.path.dirname(data_path("diagrams", "index.sqlite3"))
+    return DiagramStore(directory, max_bytes=get_setting("DIAGRAM_STORE_MAX_MB", 200, int) * 1024 * 1024)
+
+
+@contextmanager
+def _llava_slot(background):
+    """
+    llava runs on the same Ollama server, so it shares the chat model's slots. A
+    prefetch is lower priority: it also needs a "prefetch" slot and only takes an
+    Ollama slot that is free right now, never queueing in front of a chat turn.
+    """
+    limiter = get_backend_limiter()
+    if not background:
+        with limiter.slot("ollama"):
+            yield
+        return
+    with limiter.slot("prefetch", wait=0), limiter.slot("ollama", wait=0):
+        yield
+
+
+def _try_llava(prompt, span, background=False):
+    """
+    Ask the local llava model for an image; returns raw bytes or None. A background
+    (prefetch) call re-raises Busy when it couldn't get a slot.
+    """
+    router = get_router()
+    # skipped straight away while its breaker is open
+    if not router.allow("llava"):
+        span.fallback("llava", "breaker open")
+        return None
+    attempt = span.attempt("llava")
+    try:
+        with _llava_slot(background):
+            resp = get_http_session().post(
+                OLLAMA_URL,
+                json={
+                    "model": DIAGRAM_MODEL,
+                    "prompt": f"Create a labeled diagram of {prompt}",
+                    "stream": False,
+                    "keep_alive": get_model_residency().keep_alive,
+                },
+                timeout=timeout(LLAVA_PREFETCH_TIMEOUT if background else LLAVA_TIMEOUT),
+            )
+        attempt.connected()
+        resp.raise_for_status()
+        router.record_success("llava")
+        get_model_residency().touch(DIAGRAM_MODEL)
+        j = resp.json()
+    except Exception as e:
+        attempt.finish(False, type(e).__name__)
+        span.fallback("llava", type(e).__name__)
+        # no slot (Busy) isn't llava's fault; a timeout is, so a hanging llava opens
+        # the breaker instead of costing every click the full read timeout
+        if isinstance(e, Busy):
+            if background:
+                raise
+        else:
+            router.record_failure("llava", type(e).__name__)
+        return None
+    attempt.finish(True)
+    # Support an 'image' base64 field if the local endpoint returns one
+    if j.get("image"):
+        return base64.b64decode(j["image"])
+    span.fallback("llava", "no image in response")
+    return None
+
+
+def resolve_diagram(prompt, kind="diagram", background=False, llava=True):
+    """
+    Image for `prompt` without touching the UI: stored llava result, else a llava
+    attempt, else the pre-rendered placeholder. Returns bytes, or the remote placeholder
+    URL as a last resort if even the placeholder can't be fetched. Serving a placeholder
+    doesn't stop the next request from trying llava again; its breaker decides that.
+    `background` (prefetch) calls wait up to LLAVA_PREFETCH_TIMEOUT for llava and
+    return None when there was no slot for it, leaving the diagram to the click;
+    `llava=False` skips llava (one is already working on this prompt).
+    """
+    span = get_metrics().start_span(kind)
+    store = get_diagram_store()
+    topic = diagram_topic(prompt)
+    key = topic or normalize_prompt(prompt)
+    # older stores kept placeholders under the topic key too; only llava output counts here
+    stored = store.get(key, source="llava")
+    if stored is not None:
+        span.finish("store", topic=key)
+        return stored
+
+    try:
+        image = _try_llava(prompt, span, background) if llava else None
+    except Busy:
+        span.finish("skipped", topic=key)
+        return None
+    if image:
+        span.finish("llava", topic=key)
+        try:
+            return store.put(key, image, "llava")
+        except Exception:
+            return image
+
+    placeholder = topic or get_topic_index().default_diagram
+    try:
+        image = store.get(placeholder_key(placeholder)) or store.fetch_placeholder(placeholder)
+        span.finish("placeholder", topic=placeholder)
+        return image
+    except Exception as e:
+        span.fallback("placeholder", type(e).__name__)
+        span.finish("remote-url", topic=placeholder)
+        return placeholder_url(placeholder)
+
+
+class DiagramPrefetcher:
+    """
+    Speculatively resolves diagrams on a small pool as soon as an answer mentions a
+    topic, so the diagram button finds a ready image. At most `max_pending` prefetches
+    are queued (oldest queued ones are cancelled first) and unclaimed ones expire
+    after `ttl` seconds; a queued prefetch costs nothing to cancel.
+    """
+
+    def __init__(self, max_workers=2, max_pending=8, ttl=300.0):
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="biovyn-prefetch")
+        self._futures = {}  # key -> (future, created)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(prompt):
+        return diagram_topic(prompt) or normalize_prompt(prompt)
+
+    def prefetch(self, prompt):
+        key = self._key(prompt)
+        with self._lock:
+            self._expire()
+            if key in self._futures:
+                return
+            queued = [k for k, (f, _) in self._futures.items() if not f.running() and not f.done()]
+            while len(queued) >= self.max_pending:
+                oldest = queued.pop(0)
+                self._futures.pop(oldest)[0].cancel()
+            self._futures[key] = (self._pool.submit(resolve_diagram, prompt, "diagram-prefetch", True), time.monotonic())
+
+    def take(self, prompt, wait=None):
+        """
+        Result of a prefetch for `prompt` (waiting up to `wait` s if it's running), or
+        None. A prefetch that hasn't started yet is cancelled, since the caller is about
+        to resolve the diagram itself.
+        """
+        key = self._key(prompt)
+        with self._lock:
+            entry = self._futures.get(key)
+            if entry is not None and entry[0].cancel():
+                del self._futures[key]
+                return None
+        if entry is None:
+            return None
+        try:
+            return entry[0].result(timeout=wait)
+        except Exception:
+            return None
+
+    def running(self, prompt):
+        """True while a prefetch for `prompt` is still working (so it owns the llava call)."""
+        with self._lock:
+            entry = self._futures.get(self._key(prompt))
+        return entry is not None and not entry[0].done()
+
+    def _expire(self):
+        now = time.monotonic()
+        for key in [k for k, (_, created) in self._futures.items() if now - created > self.ttl]:
+            self._futures.pop(key)[0].cancel()
+
+
+@st.cache_resource
+def get_diagram_prefetcher():
+    return DiagramPrefetcher(
+        max_workers=get_setting("DIAGRAM_PREFETCH_WORKERS", 2, int),
+        max_pending=get_setting("DIAGRAM_PREFETCH_MAX_PENDING", 8, int),
+        ttl=get_setting("DIAGRAM_PREFETCH_TTL", 300.0, float),
+    )
+
+
+def warm_up(topics=None):
+    """Fill the store with a pre-rendered placeholder for every known topic."""
+    store = get_diagram_store()
+    for topic in topics or [t.id for t in get_topic_index().diagram_topics()]:
+        if store.get(placeholder_key(topic)) is not None:
+            print(f"= {topic} (already stored)")
+            continue
+        try:
+            data = store.fetch_placeholder(topic)
+            print(f"+ {topic} ({len(data) // 1024} KiB)")
+        except Exception as e:
+            print(f"! {topic}: {e}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="BiovynAI diagram store")
+    parser.add_argument("command", choices=["warm"], help="warm: pre-render every known topic")
+    parser.add_argument("topics", nargs="*", help="only these topics (default: all)")
+    args = parser.parse_args()
+    warm_up(args.topics)
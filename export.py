@@ -0,0 +1,108 @@
+# export.py — on-demand chat transcripts (TXT / Markdown / JSONL), per session or in bulk
+import json
+import sys
+import time
+
+from config import data_path
+
+# format -> (label, mime type, file extension)
+FORMATS = {
+    "txt": ("Text", "text/plain", "txt"),
+    "md": ("Markdown", "text/markdown", "md"),
+    "jsonl": ("JSON Lines", "application/x-ndjson", "jsonl"),
+}
+
+
+def format_message(message, fmt, token=""):
+    role = "You" if message["role"] == "user" else "BiovynAI"
+    if fmt == "md":
+        return f"**{role}:** {message['content']}\n\n"
+    if fmt == "jsonl":
+        record = {"session": token, "seq": message["seq"], "role": message["role"],
+                  "content": message["content"], "ts": round(message["ts"], 3)}
+        return json.dumps(record, ensure_ascii=False) + "\n"
+    return f"{role}: {message['content']}\n\n"
+
+
+def header(fmt, token, started=None):
+    when = time.strftime("%Y-%m-%d %H:%M", time.localtime(started)) if started else ""
+    if fmt == "md":
+        return f"## BiovynAI chat {when}\n\n"
+    if fmt == "txt":
+        return f"=== BiovynAI chat {when} ===\n\n"
+    return ""  # JSONL records carry the session token instead
+
+
+def iter_export(messages, fmt, token=""):
+    """Formatted chunks, one per message; `messages` is any iterable (a ChatSession pages from disk)."""
+    for message in messages:
+        yield format_message(message, fmt, token)
+
+
+class Transcript:
+    """
+    One session's export in one format, written to a file under the data dir only
+    once someone asks for it, so the text never sits in session state. Later calls
+    to `update` append just the messages added since the last one; if the chat was
+    cleared or replaced meanwhile the file is rewritten from the start.
+    """
+
+    __slots__ = ("fmt", "token", "count", "last_ts", "path")
+
+    def __init__(self, fmt, token):
+        self.fmt = fmt
+        self.token = token
+        self.count = 0
+        self.last_ts = None
+        self.path = data_path("exports", f"biovynai-chat-{token}.{FORMATS[fmt][2]}")
+
+    def update(self, session):
+        """Bring the file up to date with `session` (paged from disk) and return its path."""
+        # what's already written is only valid if its last message is still where we left it
+        if self.count and (len(session) < self.count or session[self.count - 1]["ts"] != self.last_ts):
+            self.count = 0
+        if self.count and len(session) == self.count:
+            return self.path
+        with open(self.path, "a" if self.count else "w", encoding="utf-8") as out:
+            if not self.count and session:
+                out.write(header(self.fmt, self.token, session[0]["ts"]))
+            for message in session.iter_from(self.count):
+                out.write(format_message(message, self.fmt, self.token))
+                self.count, self.last_ts = message["seq"] + 1, message["ts"]
+        return self.path
+
+
+def write_bulk(store, fmt, out):
+    """Stream every stored session to the text file `out`, one page of messages at a time."""
+    sessions = 0
+    for token, created, _active in store.tokens():
+        out.write(header(fmt, token, created))
+        for chunk in iter_export(store.iter_messages(token), fmt, token):
+            out.write(chunk)
+        sessions += 1
+    return sessions
+
+
+def bulk_export_file(store, fmt):
+    """Write all sessions to a file under the data dir; returns its path."""
+    path = data_path("exports", f"biovynai-sessions-{time.strftime('%Y%m%d-%H%M%S')}.{FORMATS[fmt][2]}")
+    with open(path, "w", encoding="utf-8") as out:
+        write_bulk(store, fmt, out)
+    return path
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from sessions import get_session_store
+
+    parser = argparse.ArgumentParser(description="Export every stored BiovynAI chat session")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="jsonl")
+    parser.add_argument("--out", default="-", help="output file (default: stdout)")
+    args = parser.parse_args()
+    if args.out == "-":
+        count = write_bulk(get_session_store(), args.format, sys.stdout)
+    else:
+        with open(args.out, "w", encoding="utf-8") as out:
+            count = write_bulk(get_session_store(), args.format, out)
+    print(f"exported {count} sessions", file=sys.stderr)
@@ -0,0 +1,281 @@
+# hedging.py — race the secondary backend against a slow primary
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import streamlit as st
+
+from config import get_setting
+from scheduler import Busy
+
+
+class LatencyTracker:
+    """Rolling window of time-to-first-token samples for one backend."""
+
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def __len__(self):
+        return len(self._samples)
+
+
+class HedgePolicy:
+    """
+    Decides the hedge delay and caps how often hedges may fire, so the secondary
+    (paid) backend only ever sees a bounded share of traffic.
+    """
+
+    def __init__(self, tracker, quantile=0.95, default_budget=3.0, min_budget=0.5, max_budget=8.0,
+                 max_fraction=0.2, max_per_minute=20, min_samples=20):
+        self.tracker = tracker
+        self.quantile = quantile
+        self.default_budget = default_budget
+        self.min_budget = min_budget
+        self.max_budget = max_budget
+        self.max_fraction = max_fraction
+        self.max_per_minute = max_per_minute
+        self.min_samples = min_samples
+        self._requests = deque(maxlen=500)  # [timestamp, hedged] per race
+        self._hedges = deque()  # timestamps of hedges fired
+        self._lock = threading.Lock()
+
+    def budget(self):
+        """How long the primary gets before the secondary is launched."""
+        if len(self.tracker) < self.min_samples:
+            return self.default_budget
+        return min(self.max_budget, max(self.min_budget, self.tracker.percentile(self.quantile)))
+
+    def _trim(self, now):
+        while self._requests and now - self._requests[0][0] >= 60:
+            self._requests.popleft()
+        while self._hedges and now - self._hedges[0] >= 60:
+            self._hedges.popleft()
+
+    def note_request(self):
+        """Count a race toward the caps; returns its record for `try_hedge`."""
+        request = [time.monotonic(), False]
+        with self._lock:
+            self._requests.append(request)
+        return request
+
+    def try_hedge(self, request):
+        """Reserve a hedge for `request` if the rate caps allow it."""
+        with self._lock:
+            if request[1]:
+                return False
+            now = time.monotonic()
+            self._trim(now)
+            if len(self._hedges) >= self.max_per_minute:
+                return False
+            if self._requests and (len(self._hedges) + 1) / len(self._requests) > self.max_fraction:
+                return False
+            request[1] = True
+            self._hedges.append(now)
+            return True
+
+
+class Cancel:
+    """
+    Cancel flag for one pumped stream. The stream registers how to interrupt it while
+    it waits on the network (`abort_on_cancel`), so a losing backend gives up its
+    connection and slot as soon as it loses, not at its next chunk or timeout.
+    """
+
+    def __init__(self):
+        self._set = False
+        self._closers = []
+        self._lock = threading.Lock()
+
+    def is_set(self):
+        return self._set
+
+    def set(self):
+        with self._lock:
+            if self._set:
+                return
+            self._set = True
+            for close in self._closers:
+                close()
+
+    @contextmanager
+    def closing(self, close):
+        with self._lock:
+            if self._set:
+                close()
+            self._closers.append(close)
+        try:
+            yield
+        finally:
+            # under the lock, so `close` never runs once the stream has let go of it
+            with self._lock:
+                self._closers.remove(close)
+
+
+_pumping = threading.local()  # .cancel: the Cancel of the stream this worker is pumping
+
+
+@contextmanager
+def abort_on_cancel(close):
+    """Within a hedge race, call `close` if the stream running this block is cancelled."""
+    cancel = getattr(_pumping, "cancel", None)
+    if cancel is None:
+        yield
+        return
+    with cancel.closing(close):
+        yield
+
+
+def cancelled():
+    """True when the stream running on this thread lost its hedge race."""
+    cancel = getattr(_pumping, "cancel", None)
+    return cancel is not None and cancel.is_set()
+
+
+def _pump(source, open_stream, events, cancel):
+    """Run one backend stream on a worker thread, forwarding chunks until done or cancelled."""
+    stream = None
+    _pumping.cancel = cancel
+    try:
+        stream = open_stream()
+        for piece in stream:
+            if cancel.is_set():
+                return
+            events.put((source, "chunk", piece))
+        events.put((source, "done", None))
+    except Exception as e:
+        events.put((source, "error", e))
+    finally:
+        if stream is not None and hasattr(stream, "close"):
+            # closes the underlying HTTP response of a cancelled loser
+            stream.close()
+        _pumping.cancel = None
+
+
+class HedgedRace:
+    """
+    Start `primary`; if it hasn't produced a first chunk within the policy budget
+    (and the policy allows a hedge) start `secondary` too. The first backend to
+    produce a chunk wins and the other is cancelled. A primary that fails outright
+    falls back to the secondary immediately, like the sequential path.
+
+    Call the instance to get the winner's chunk iterator; `winner` and `hedged` are
+    set before the first chunk is yielded.
+    """
+
+    def __init__(self, primary, secondary, policy, pool, can_start=None):
+        self.primary = primary        # (name, open_stream)
+        self.secondary = secondary
+        self.policy = policy
+        self.pool = pool
+        self.can_start = can_start or (lambda source: True)
+        self.winner = None
+        self.hedged = False
+
+    def __call__(self):
+        events = queue.Queue()
+        cancels = {}
+        started = time.monotonic()
+        primary_name = self.primary[0]
+
+        def launch(entry):
+            name, open_stream = entry
+            cancels[name] = Cancel()
+            self.pool.submit(_pump, name, open_stream, events, cancels[name])
+
+        request = self.policy.note_request()
+        launch(self.primary)
+        hedge_decided = False
+        finished = set()
+        errors = []
+        try:
+            while self.winner is None:
+                wait = None
+                if not hedge_decided:
+                    wait = max(0.0, self.policy.budget() - (time.monotonic() - started))
+                try:
+                    source, kind, payload = events.get(timeout=wait)
+                except queue.Empty:
+                    # budget spent; without an allowed hedge we simply keep waiting on the primary
+                    hedge_decided = True
+                    if self.can_start(self.secondary[0]) and self.policy.try_hedge(request):
+                        self.hedged = True
+                        launch(self.secondary)
+                    continue
+
+                if kind == "chunk":
+                    self.winner = source
+                    if source == primary_name:
+                        self.policy.tracker.record(time.monotonic() - started)
+                    first = payload
+                    break
+
+                finished.add(source)
+                if kind == "error":
+                    errors.append(payload)
+                # a primary without a free slot is raised (Busy) rather than failed over
+                if source == primary_name and self.secondary[0] not in cancels and not isinstance(payload, Busy):
+                    hedge_decided = True
+                    if self.can_start(self.secondary[0]):
+                        launch(self.secondary)
+                        continue
+                if all(name in finished for name in cancels):
+                    if errors:
+                        raise errors[-1]
+                    return
+
+            # cancel the loser; if the primary lost, its latency was at least this long
+            for name, cancel in cancels.items():
+                if name != self.winner:
+                    cancel.set()
+                    if name == primary_name and name not in finished:
+                        self.policy.tracker.record(time.monotonic() - started)
+
+            yield first
+            while True:
+                source, kind, payload = events.get()
+                if source != self.winner:
+                    continue
+                if kind == "chunk":
+                    yield payload
+                elif kind == "error":
+                    raise payload
+                else:
+                    return
+        finally:
+            # consumer went away (or we finished): stop anything still running
+            for cancel in cancels.values():
+                cancel.set()
+
+
+@st.cache_resource
+def get_hedge_policy():
+    """Process-wide hedge policy fed by observed Ollama time-to-first-token."""
+    return HedgePolicy(
+        LatencyTracker(),
+        quantile=get_setting("HEDGE_QUANTILE", 0.95, float),
+        default_budget=get_setting("HEDGE_DEFAULT_BUDGET", 3.0, float),
+        min_budget=get_setting("HEDGE_MIN_BUDGET", 0.5, float),
+        max_budget=get_setting("HEDGE_MAX_BUDGET", 8.0, float),
+        max_fraction=get_setting("HEDGE_MAX_FRACTION", 0.2, float),
+        max_per_minute=get_setting("HEDGE_MAX_PER_MINUTE", 20, int),
+    )
+
+
+@st.cache_resource
+def get_hedge_pool():
+    return ThreadPoolExecutor(max_workers=get_setting("HEDGE_WORKERS", 32, int), thread_name_prefix="biovyn-hedge")
@@ -0,0 +1,168 @@
+# jobs.py — background answer generation shared by every Streamlit session
+import threading
+import time
+import uuid
+
+import streamlit as st
+
+from backend import MODEL_TAG, stream_biovyn_response
+from cache import make_key
+from config import get_setting
+from scheduler import Busy, FairQueue, RateLimiter
+
+
+class GenerationJob:
+    """One upstream generation; any number of sessions may watch it."""
+
+    def __init__(self, key, prompt, study_mode, context=None, ollama_context=None, session=None):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.session = session or self.id
+        self.prompt = prompt
+        self.study_mode = study_mode
+        self.context = context
+        self.ollama_context = ollama_context
+        self.created = time.monotonic()
+        self.started = None
+        self.finished = None
+        self.watchers = 1
+        self.stats = {}
+        self.error = None
+        self._chunks = []
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    @property
+    def queued(self):
+        return self.started is None
+
+    @property
+    def text(self):
+        return "".join(self._chunks)
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+
+class JobManager:
+    """
+    Bounded worker pool for LLM calls plus single-flight coalescing: while a job
+    for the same (normalized prompt, mode, model, prior context) is in flight, new submissions
+    attach to it instead of making another upstream call.
+    Admission control sits in front (see scheduler.py): each session is rate limited,
+    and jobs wait in a bounded queue that workers drain round-robin across sessions.
+    `submit` raises scheduler.Busy instead of queueing once either limit is hit.
+    A job whose backend had no free slot goes back to the front of its session's
+    line; after `max_wait` seconds it finishes with that Busy as its error.
+    """
+
+    def __init__(self, max_workers=8, retention=600.0, queue_size=32, rate_limiter=None, max_wait=60.0):
+        self.retention = retention
+        self.max_wait = max_wait
+        self.coalesced = 0
+        self.rejected = 0
+        self._queue = FairQueue(queue_size)
+        self._rate = rate_limiter
+        self._jobs = {}       # job id -> job (kept for `retention` seconds after finishing)
+        self._in_flight = {}  # coalescing key -> queued or running job
+        self._lock = threading.Lock()
+        for i in range(max_workers):
+            threading.Thread(target=self._work, name=f"biovyn-gen-{i}", daemon=True).start()
+
+    def submit(self, prompt, study_mode=False, context=None, ollama_context=None, session=None):
+        if session and self._rate is not None:
+            try:
+                self._rate.take(session)
+            except Busy:
+                self.rejected += 1
+                raise
+        digest = context.digest() if context is not None else ""
+        key = make_key(prompt, study_mode, f"{MODEL_TAG}|{digest}")
+        with self._lock:
+            self._forget_finished()
+            job = self._in_flight.get(key)
+            if job is not None:
+                job.watchers += 1
+                self.coalesced += 1
+                return job
+            job = GenerationJob(key, prompt, study_mode, context, ollama_context, session)
+            try:
+                self._queue.put(job.session, job)
+            except Busy:
+                # a full queue isn't the session's fault: give its token back
+                self.rejected += 1
+                if session and self._rate is not None:
+                    self._rate.refund(session)
+                raise
+            self._jobs[job.id] = job
+            self._in_flight[key] = job
+        return job
+
+    def position(self, job):
+        """Where a queued job stands in line (1 = next), or None once it has started."""
+        return self._queue.position(job.session, job) if job.queued else None
+
+    def _work(self):
+        while True:
+            self._run(self._queue.get())
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job):
+        job.started = time.monotonic()
+        requeued = False
+        try:
+            for chunk in stream_biovyn_response(
+                job.prompt, job.study_mode, stats=job.stats, context=job.context, ollama_context=job.ollama_context
+            ):
+                job._chunks.append(chunk)
+        except Busy:
+            # raised before any text: wait in line for a slot instead of failing over
+            if time.monotonic() - job.created < self.max_wait:
+                job.started = None
+                job.stats.clear()
+                self._queue.requeue(job.session, job)
+                requeued = True
+            else:
+                job.error = Busy("BiovynAI is answering lots of questions right now", retry_after=10.0)
+        except Exception as e:
+            job.error = e
+        finally:
+            if not requeued:
+                with self._lock:
+                    self._in_flight.pop(job.key, None)
+                job.finished = time.monotonic()
+                job._done.set()
+
+    def _forget_finished(self):
+        now = time.monotonic()
+        for job_id in [j.id for j in self._jobs.values() if j.finished and now - j.finished > self.retention]:
+            del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._in_flight),
+                "queued": len(self._queue),
+                "coalesced": self.coalesced,
+                "rejected": self.rejected,
+            }
+
+
+@st.cache_resource
+def get_job_manager():
+    return JobManager(
+        max_workers=get_setting("GENERATION_WORKERS", 8, int),
+        retention=get_setting("JOB_RETENTION_SECONDS", 600.0, float),
+        queue_size=get_setting("QUEUE_MAX", 32, int),
+        max_wait=get_setting("QUEUE_MAX_WAIT", 60.0, float),
+        rate_limiter=RateLimiter(
+            per_minute=get_setting("SESSION_RATE_PER_MINUTE", 6, float),
+            burst=get_setting("SESSION_BURST", 3, int),
+        ),
+    )
@@ -0,0 +1,313 @@
+# metrics.py — per-request timing spans, in-process counters/histograms, Prometheus exporter
+import json
+import logging
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+
+import streamlit as st
+
+from config import data_path, get_setting
+
+log = logging.getLogger("biovyn.metrics")
+
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf"))
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v).replace(chr(34), chr(39))}"' for k, v in pairs) + "}"
+
+
+class Registry:
+    """Thread-safe counters and fixed-bucket histograms, rendered in Prometheus text format."""
+
+    def __init__(self):
+        self._counters = {}    # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+        self._help = {}
+        self._gauge_callbacks = []
+        self._lock = threading.Lock()
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0] * len(BUCKETS) + [0.0, 0]
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    hist[i] += 1
+            hist[-2] += value
+            hist[-1] += 1
+
+    def add_gauge_callback(self, callback):
+        """`callback()` returns [(name, labels dict, value), ...], evaluated at scrape time."""
+        self._gauge_callbacks.append(callback)
+
+    def counter(self, name, **labels):
+        """Sum of every series of `name` whose labels include `labels`."""
+        wanted = set(_labels(labels))
+        with self._lock:
+            return sum(v for (n, l), v in self._counters.items() if n == name and wanted <= set(l))
+
+    def quantile(self, name, q, **labels):
+        """Approximate quantile (bucket upper bound) across all series matching `labels`."""
+        wanted = set(_labels(labels))
+        with self._lock:
+            series = [h for (n, l), h in self._histograms.items() if n == name and wanted <= set(l)]
+        if not series:
+            return None
+        counts = [sum(h[i] for h in series) for i in range(len(BUCKETS))]
+        total = counts[-1]
+        if not total:
+            return None
+        for bound, cumulative in zip(BUCKETS, counts):
+            if cumulative >= q * total:
+                return bound
+        return BUCKETS[-1]
+
+    def render(self):
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), hist in histograms:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+            for bound, count in zip(BUCKETS, hist):
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', le)])} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {hist[-2]}")
+            lines.append(f"{name}_count{_format_labels(labels)} {hist[-1]}")
+        for callback in self._gauge_callbacks:
+            try:
+                for name, labels, value in callback():
+                    if name not in seen:
+                        seen.add(name)
+                        lines.append(f"# TYPE {name} gauge")
+                    lines.append(f"{name}{_format_labels(_labels(labels))} {value}")
+            except Exception:
+                log.exception("gauge callback failed")
+        return "\n".join(lines) + "\n"
+
+
+class BackendAttempt:
+    """One try against one backend inside a request."""
+
+    __slots__ = ("backend", "started", "connect_s", "first_token_s", "response_s", "ok", "error")
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.started = time.perf_counter()
+        self.connect_s = self.first_token_s = self.response_s = None
+        self.ok = None
+        self.error = None
+
+    def connected(self):
+        self.connect_s = time.perf_counter() - self.started
+
+    def first_token(self):
+        self.first_token_s = time.perf_counter() - self.started
+
+    def finish(self, ok, error=None):
+        if self.ok is None:
+            self.ok = ok
+            self.error = error
+            self.response_s = time.perf_counter() - self.started
+
+    def as_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__ if k != "started"}
+
+
+class RequestSpan:
+    """Timing record for one chat answer or diagram, finished exactly once."""
+
+    def __init__(self, metrics, kind, **fields):
+        self.metrics = metrics
+        self.kind = kind
+        self.fields = fields
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.attempts = []
+        self.fallbacks = []  # (backend, reason)
+        self.tokens = 0
+        self._lock = threading.Lock()
+        self._finished = False
+
+    def attempt(self, backend):
+        attempt = BackendAttempt(backend)
+        with self._lock:
+            self.attempts.append(attempt)
+        return attempt
+
+    def fallback(self, backend, reason):
+        with self._lock:
+            self.fallbacks.append((backend, reason))
+
+    def finish(self, source, **fields):
+        with self._lock:
+            if self._finished:
+                return
+            self._finished = True
+        self.fields.update(fields)
+        self.metrics.record(self, source, time.perf_counter() - self._start)
+
+
+class Metrics:
+    def __init__(self, event_log_path=None, max_bytes=10 * 1024 * 1024, backups=5):
+        self.registry = Registry()
+        for name, text in (
+            ("biovyn_requests_total", "Finished requests by kind and final source"),
+            ("biovyn_request_seconds", "End-to-end request duration"),
+            ("biovyn_ttft_seconds", "Time to first token of chat answers"),
+            ("biovyn_backend_attempts_total", "Backend attempts by outcome"),
+            ("biovyn_backend_connect_seconds", "Time until the backend sent response headers"),
+            ("biovyn_backend_response_seconds", "Time until the backend attempt finished"),
+            ("biovyn_fallbacks_total", "Times a backend was skipped or failed over, by reason"),
+            ("biovyn_cache_lookups_total", "Answer cache results"),
+            ("biovyn_tokens_total", "Answer tokens (chunks) delivered by source"),
+        ):
+            self.registry.describe(name, text)
+        self._events = None
+        if event_log_path:
+            self._events = logging.getLogger("biovyn.events")
+            self._events.propagate = False
+            self._events.setLevel(logging.INFO)
+            if not self._events.handlers:
+                handler = RotatingFileHandler(event_log_path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                self._events.addHandler(handler)
+        self._server = None
+
+    def start_span(self, kind, **fields):
+        return RequestSpan(self, kind, **fields)
+
+    def record(self, span, source, duration):
+        r = self.registry
+        r.inc("biovyn_requests_total", kind=span.kind, source=source)
+        r.observe("biovyn_request_seconds", duration, kind=span.kind, source=source)
+        if span.fields.get("ttft") is not None:
+            r.observe("biovyn_ttft_seconds", span.fields["ttft"], source=source)
+        if span.kind == "chat":
+            cache = {"cache": "hit_exact", "semantic-cache": "hit_semantic"}.get(source, "miss")
+            r.inc("biovyn_cache_lookups_total", result=cache)
+            r.inc("biovyn_tokens_total", span.tokens, source=source)
+        for attempt in span.attempts:
+            outcome = "ok" if attempt.ok else (attempt.error or "unknown")
+            r.inc("biovyn_backend_attempts_total", backend=attempt.backend, outcome=outcome)
+            if attempt.connect_s is not None:
+                r.observe("biovyn_backend_connect_seconds", attempt.connect_s, backend=attempt.backend)
+            if attempt.response_s is not None:
+                r.observe("biovyn_backend_response_seconds", attempt.response_s, backend=attempt.backend)
+        for backend, reason in span.fallbacks:
+            r.inc("biovyn_fallbacks_total", backend=backend, reason=reason)
+
+        if self._events is not None:
+            event = {
+                "ts": round(span.started_at, 3),
+                "kind": span.kind,
+                "source": source,
+                "duration_s": round(duration, 4),
+                "tokens": span.tokens,
+                "attempts": [a.as_dict() for a in span.attempts],
+                "fallbacks": [{"backend": b, "reason": why} for b, why in span.fallbacks],
+                **span.fields,
+            }
+            self._events.info(json.dumps(event, default=str))
+
+    def summary(self):
+        """Headline numbers for the admin panel."""
+        r = self.registry
+        total = r.counter("biovyn_requests_total", kind="chat")
+        hits = r.counter("biovyn_cache_lookups_total", result="hit_exact") + r.counter(
+            "biovyn_cache_lookups_total", result="hit_semantic")
+        return {
+            "chat requests": total,
+            "answered by Ollama": r.counter("biovyn_requests_total", kind="chat", source="ollama"),
+            "fell back to OpenAI": r.counter("biovyn_requests_total", kind="chat", source="openai"),
+            "offline answers": r.counter("biovyn_requests_total", kind="chat", source="offline"),
+            "Ollama timeouts": r.counter("biovyn_backend_attempts_total", backend="ollama", outcome="ReadTimeout")
+            + r.counter("biovyn_backend_attempts_total", backend="ollama", outcome="ConnectTimeout"),
+            "cache hit rate": f"{hits / total:.0%}" if total else "–",
+            "p50 latency (s)": r.quantile("biovyn_request_seconds", 0.5, kind="chat"),
+            "p95 latency (s)": r.quantile("biovyn_request_seconds", 0.95, kind="chat"),
+            "p95 first token (s)": r.quantile("biovyn_ttft_seconds", 0.95),
+            "diagrams": r.counter("biovyn_requests_total", kind="diagram"),
+        }
+
+    def start_exporter(self, port, host="127.0.0.1"):
+        """Serve /metrics in Prometheus text format on a side port (daemon thread)."""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        try:
+            self._server = ThreadingHTTPServer((host, port), Handler)
+        except OSError as e:
+            # e.g. a second Streamlit process on the same host — metrics stay in-process
+            log.warning("metrics exporter not started on %s:%s: %s", host, port, e)
+            return None
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="biovyn-metrics", daemon=True).start()
+        return self._server
+
+
+@st.cache_resource
+def get_metrics():
+    event_log = None
+    if get_setting("EVENT_LOG_ENABLED", True, bool):
+        event_log = data_path("logs", "requests.jsonl")
+    metrics = Metrics(
+        event_log,
+        max_bytes=get_setting("EVENT_LOG_MAX_MB", 10, int) * 1024 * 1024,
+        backups=get_setting("EVENT_LOG_BACKUPS", 5, int),
+    )
+    def breaker_gauges():
+        from router import get_router
+        return [("biovyn_breaker_open", {"backend": name}, int(state == "open"))
+                for name, state in get_router().snapshot().items()]
+
+    metrics.registry.add_gauge_callback(breaker_gauges)
+    port = get_setting("METRICS_PORT", 9464, int)
+    if port:
+        metrics.start_exporter(port, get_setting("METRICS_HOST", "127.0.0.1"))
+    return metrics
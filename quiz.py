@@ -0,0 +1,270 @@
+# quiz.py — pre-generated multiple-choice quiz bank, served without any LLM call
+import hashlib
+import json
+import random
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+from cache import normalize_prompt
+from config import data_path, get_setting
+
+QUIZ_PROMPT = """Write {count} multiple-choice quiz questions for high-school biology students about "{topic}".
+Return only a JSON array, no other text. Each item must look like:
+{{"question": "...", "options": ["...", "...", "...", "..."], "answer": <index 0-3 of the correct option>, "explanation": "one short sentence"}}
+Exactly one option is correct. Vary the difficulty and the part of the topic being tested.{avoid}"""
+
+
+def parse_questions(text):
+    """Quiz items from a model reply: a JSON array (possibly inside prose or code fences), else one object per line."""
+    start, end = text.find("["), text.rfind("]")
+    if start != -1 and end > start:
+        try:
+            items = json.loads(text[start:end + 1])
+            if isinstance(items, list):
+                return items
+        except ValueError:
+            pass
+    items = []
+    for line in text.splitlines():
+        line = line.strip().rstrip(",")
+        if line.startswith("{"):
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                continue
+    return items
+
+
+def validate(item):
+    """The item as a clean 4-option question dict, or None if it isn't one."""
+    if not isinstance(item, dict):
+        return None
+    question = str(item.get("question") or "").strip()
+    options = item.get("options")
+    if not 10 <= len(question) <= 300 or not isinstance(options, list) or len(options) != 4:
+        return None
+    # models like to prefix options with "A)" / "b." — drop that
+    options = [re.sub(r"^[A-Da-d][).:]\s+", "", str(o)).strip() for o in options]
+    if not all(options) or len({o.lower() for o in options}) != 4 or max(map(len, options)) > 160:
+        return None
+    answer = item.get("answer")
+    if isinstance(answer, str):
+        text = answer.strip()
+        if len(text) == 1 and text.upper() in "ABCD":
+            answer = "ABCD".index(text.upper())
+        elif text.isdigit():
+            answer = int(text)
+        else:
+            answer = next((i for i, o in enumerate(options) if o.lower() == text.lower()), None)
+    if isinstance(answer, bool) or not isinstance(answer, int) or not 0 <= answer < 4:
+        return None
+    explanation = str(item.get("explanation") or "").strip()[:400]
+    return {"question": question, "options": options, "answer": answer, "explanation": explanation}
+
+
+def fingerprint(question):
+    return hashlib.sha1(normalize_prompt(question).encode("utf-8")).hexdigest()[:16]
+
+
+class QuizBank:
+    """
+    Multiple-choice questions per topic, stored in SQLite with a unique (topic,
+    normalized question) key so regenerated duplicates are simply dropped. Each
+    topic's question ids are mirrored in memory as a compact int array, so serving
+    is a random pick plus one primary-key read — no LLM on that path.
+
+    `generate(prompt) -> text` is only used by `fill`, which runs on one background
+    thread when a topic's pool runs low (or from the CLI). Filling only counts
+    what's already banked, so an interrupted run just continues next time.
+    """
+
+    def __init__(self, path, generate=None, target=20, low_water=8, max_per_topic=200, batch=5, cooldown=300.0):
+        self.target = target
+        self.low_water = low_water
+        self.max_per_topic = max_per_topic
+        self.batch = batch
+        self.cooldown = cooldown
+        self.stats = {"added": 0, "duplicates": 0, "invalid": 0}
+        self._generate = generate
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS questions ("
+            " id INTEGER PRIMARY KEY, topic TEXT NOT NULL, fingerprint TEXT NOT NULL, question TEXT NOT NULL,"
+            " options TEXT NOT NULL, answer INTEGER NOT NULL, explanation TEXT NOT NULL, created REAL NOT NULL,"
+            " UNIQUE (topic, fingerprint))"
+        )
+        self._db.commit()
+        self._ids = {}  # topic -> array of question ids
+        for topic, qid in self._db.execute("SELECT topic, id FROM questions ORDER BY id"):
+            self._ids.setdefault(topic, array("l")).append(qid)
+        self._filling = set()
+        self._started = {}  # topic -> when its last background fill started
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="biovyn-quiz")
+
+    def count(self, topic):
+        with self._lock:
+            return len(self._ids.get(topic, ()))
+
+    def counts(self):
+        with self._lock:
+            return {topic: len(ids) for topic, ids in self._ids.items()}
+
+    # ── serving ───────────────────────────────
+
+    def next_question(self, topic, seen=()):
+        """
+        A random question on `topic` that isn't in `seen` (ids), falling back to a repeat
+        once all are seen; None while the topic has no questions yet. May schedule a
+        background top-up, but never waits for one.
+        """
+        with self._lock:
+            ids = self._ids.get(topic, ())
+            unseen = [qid for qid in ids if qid not in seen] if seen else list(ids)
+            running_low = len(ids) < self.low_water or (len(unseen) < 2 and len(ids) < self.max_per_topic)
+            qid = random.choice(unseen or ids) if ids else None
+            row = None
+            if qid is not None:
+                row = self._db.execute(
+                    "SELECT question, options, answer, explanation FROM questions WHERE id = ?", (qid,)
+                ).fetchone()
+        if running_low:
+            # a thin pool is filled to `target`; a caller who has seen nearly everything gets one more batch
+            self.top_up(topic, None if len(ids) < self.low_water else len(ids) + self.batch)
+        if row is None:
+            return None
+        return {"id": qid, "topic": topic, "question": row[0], "options": json.loads(row[1]),
+                "answer": row[2], "explanation": row[3]}
+
+    # ── generation ────────────────────────────
+
+    def add(self, topic, items):
+        """Validate and store generated items; returns how many were new."""
+        added, now = 0, time.time()
+        with self._lock:
+            for item in items:
+                question = validate(item)
+                if question is None:
+                    self.stats["invalid"] += 1
+                    continue
+                cursor = self._db.execute(
+                    "INSERT OR IGNORE INTO questions (topic, fingerprint, question, options, answer, explanation, created)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (topic, fingerprint(question["question"]), question["question"],
+                     json.dumps(question["options"]), question["answer"], question["explanation"], now),
+                )
+                if cursor.rowcount:
+                    self._ids.setdefault(topic, array("l")).append(cursor.lastrowid)
+                    added += 1
+                else:
+                    self.stats["duplicates"] += 1
+            self._db.commit()
+            self.stats["added"] += added
+        return added
+
+    def _recent_questions(self, topic, limit=15):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT question FROM questions WHERE topic = ? ORDER BY id DESC LIMIT ?", (topic, limit)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def fill(self, topic, target=None):
+        """Generate questions until `topic` has `target` of them; returns the final count."""
+        target = min(target or self.target, self.max_per_topic)
+        empty_rounds = 0
+        while self.count(topic) < target and empty_rounds < 2:
+            recent = self._recent_questions(topic)
+            # listing what we already have steers the model away from repeats
+            avoid = "\nDo not repeat any of these questions:\n" + "\n".join(f"- {q}" for q in recent) if recent else ""
+            prompt = QUIZ_PROMPT.format(count=self.batch, topic=topic, avoid=avoid)
+            try:
+                text = self._generate(prompt)
+            except Exception:
+                break
+            empty_rounds = 0 if self.add(topic, parse_questions(text)) else empty_rounds + 1
+        return self.count(topic)
+
+    def top_up(self, topic, target=None):
+        """Queue a background fill for `topic`: one at a time, and one per `cooldown` seconds."""
+        if self._generate is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            # every session's first look at a thin topic lands here; one fill serves them
+            # all, and a backend that produced little isn't asked again straight away
+            if topic in self._filling or now - self._started.get(topic, -self.cooldown) < self.cooldown:
+                return
+            self._filling.add(topic)
+            self._started[topic] = now
+        self._pool.submit(self._fill_in_background, topic, target)
+
+    def _fill_in_background(self, topic, target):
+        try:
+            self.fill(topic, target)
+        finally:
+            with self._lock:
+                self._filling.discard(topic)
+
+
+def _generate_with_backends(prompt):
+    # imported here so the quiz can be served without loading the backends
+    from backend import generate_text
+    from jobs import get_job_manager
+
+    # top-ups are background work: students' queued questions go first
+    while get_job_manager().stats()["queued"]:
+        time.sleep(1.0)
+    # uncached and ungrounded, with room for a whole JSON batch
+    return generate_text(prompt, get_setting("QUIZ_MAX_TOKENS", 1024, int), kind="quiz")
+
+
+@st.cache_resource
+def get_quiz_bank():
+    """Process-wide quiz bank shared by every Streamlit session."""
+    return QuizBank(
+        data_path("quiz.sqlite3"),
+        generate=_generate_with_backends if get_setting("QUIZ_TOP_UPS", True, bool) else None,
+        target=get_setting("QUIZ_TARGET_PER_TOPIC", 20, int),
+        low_water=get_setting("QUIZ_LOW_WATER", 8, int),
+        max_per_topic=get_setting("QUIZ_MAX_PER_TOPIC", 200, int),
+        batch=get_setting("QUIZ_BATCH", 5, int),
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="BiovynAI quiz bank")
+    sub = parser.add_subparsers(dest="command", required=True)
+    generate = sub.add_parser("generate", help="fill every topic (or the given ones) up to --per-topic questions")
+    generate.add_argument("topics", nargs="*", help="only these topics (default: all of topics.json)")
+    generate.add_argument("--per-topic", type=int, default=None)
+    sub.add_parser("stats", help="questions banked per topic")
+    args = parser.parse_args()
+
+    from streamlit.logger import set_log_level
+
+    from topics import get_topic_index
+
+    bank = QuizBank(data_path("quiz.sqlite3"), generate=_generate_with_backends,
+                    target=get_setting("QUIZ_TARGET_PER_TOPIC", 20, int), batch=get_setting("QUIZ_BATCH", 5, int))
+    if args.command == "generate":
+        import backend  # noqa: F401
+
+        set_log_level("error")  # after Streamlit has read its config; see batch.py
+        for topic in args.topics or sorted(get_topic_index().topics):
+            before = bank.count(topic)
+            after = bank.fill(topic, args.per_topic)
+            print(f"{topic:>16}: {before} -> {after}")
+        print(bank.stats)
+    else:
+        for topic, count in sorted(bank.counts().items()):
+            print(f"{topic:>16}: {count}")
@@ -0,0 +1,9 @@
+# render.py — HTML for chat bubbles, cached for the life of the server process
+from functools import lru_cache
+
+
+@lru_cache(maxsize=4096)
+def bubble_html(role, content):
+    """One chat message as a styled bubble; built once per message and reused on every rerun."""
+    css = "user-bubble" if role == "user" else "bot-bubble"
+    return f"<div class='{css}'>{content}</div>"
@@ -0,0 +1,108 @@
+# residency.py — keep Ollama models loaded and tune per-mode generation
+import logging
+import threading
+import time
+
+import streamlit as st
+
+from config import get_setting
+from router import get_router
+from transport import get_http_session, timeout
+
+log = logging.getLogger("biovyn.residency")
+
+
+class ModelResidency:
+    """
+    Preloads the configured Ollama models at startup and re-pings them before their
+    keep-alive runs out, so no user pays for a cold load after an idle period.
+    Also owns the per-mode generation options sent with every request.
+    """
+
+    def __init__(self, ollama_url, models, keep_alive="30m", refresh_interval=600.0,
+                 num_ctx=4096, num_predict=512, study_num_predict=1536):
+        self.ollama_url = ollama_url
+        self.models = list(models)
+        self.keep_alive = keep_alive
+        self.refresh_interval = refresh_interval
+        self.num_ctx = num_ctx
+        self.num_predict = num_predict
+        self.study_num_predict = study_num_predict
+        self.loaded = {}  # model -> monotonic time of the last successful load/use
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def options(self, study_mode=False):
+        """Ollama `options` for a chat request: context size and a per-mode answer cap."""
+        return {
+            "num_ctx": self.num_ctx,
+            "num_predict": self.study_num_predict if study_mode else self.num_predict,
+        }
+
+    def max_reused_context(self):
+        """Longest returned `context` we'll send back before starting over from a transcript."""
+        return int(self.num_ctx * 0.75)
+
+    def touch(self, model):
+        with self._lock:
+            self.loaded[model] = time.monotonic()
+
+    def preload(self, model):
+        """Load `model` into memory (a generate call without a prompt only loads it)."""
+        try:
+            resp = get_http_session().post(
+                self.ollama_url,
+                json={"model": model, "keep_alive": self.keep_alive, "stream": False},
+                timeout=timeout(120),
+            )
+            resp.raise_for_status()
+        except Exception as e:
+            log.warning("could not preload %s: %s", model, e)
+            return False
+        self.touch(model)
+        log.info("model %s resident (keep_alive=%s)", model, self.keep_alive)
+        return True
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="biovyn-residency", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        for model in self.models:
+            self.preload(model)
+        while not self._stop.wait(self.refresh_interval):
+            router = get_router()
+            for model in self.models:
+                with self._lock:
+                    idle = time.monotonic() - self.loaded.get(model, 0.0)
+                # only ping models nobody used recently, and never a host we know is down
+                if idle >= self.refresh_interval and router.is_available("ollama"):
+                    self.preload(model)
+
+
+@st.cache_resource
+def get_model_residency():
+    """Process-wide; the first call (app startup) starts preloading in the background."""
+    models = get_setting("OLLAMA_RESIDENT_MODELS")
+    if models:
+        models = [m.strip() for m in models.split(",") if m.strip()]
+    else:
+        models = [get_setting("OLLAMA_MODEL", "llama3:3b"), get_setting("DIAGRAM_MODEL", "llava:latest")]
+    residency = ModelResidency(
+        get_setting("OLLAMA_URL", "http://localhost:11434/api/generate"),
+        models,
+        keep_alive=get_setting("OLLAMA_KEEP_ALIVE", "30m"),
+        refresh_interval=get_setting("OLLAMA_REFRESH_INTERVAL", 600.0, float),
+        num_ctx=get_setting("OLLAMA_NUM_CTX", 4096, int),
+        num_predict=get_setting("OLLAMA_NUM_PREDICT", 512, int),
+        study_num_predict=get_setting("OLLAMA_STUDY_NUM_PREDICT", 1536, int),
+    )
+    if get_setting("OLLAMA_PRELOAD", True, bool):
+        residency.start()
+    return residency
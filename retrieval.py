@@ -0,0 +1,373 @@
+# retrieval.py — local BM25 search over a folder of biology notes (offline answers, prompt grounding)
+import json
+import math
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+
+import streamlit as st
+
+from config import data_path, get_setting
+from context import estimate_tokens
+
+CORPUS_DIR = get_setting("CORPUS_DIR", "notes")
+NOTE_EXTENSIONS = (".md", ".markdown", ".txt")
+STOPWORDS = frozenset(
+    "a an and are as at be been by can do does for from how i in into is it its me of on or so that the "
+    "their them then there these they this to was were what when where which who why will with you your "
+    "about explain describe tell please".split()
+)
+_WORD = re.compile(r"[a-z0-9]+")
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+
+
+def _stem(word):
+    # plural folding only ("cells" -> "cell", "bodies" -> "body"); enough for notes-sized corpora
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    return [_stem(w) for w in _WORD.findall(text.lower()) if len(w) > 1 and w not in STOPWORDS]
+
+
+def split_passages(text, max_words=120):
+    """(heading, passage) pairs: paragraphs under their nearest Markdown heading, merged up to `max_words`."""
+    passages, heading, block_parts, words = [], "", [], 0
+
+    def flush():
+        nonlocal block_parts, words
+        if block_parts:
+            passages.append((heading, "\n\n".join(block_parts)))
+        block_parts, words = [], 0
+
+    for block in re.split(r"\n\s*\n", text):
+        block = block.strip()
+        if block.startswith("#"):
+            flush()
+            first, _, block = block.partition("\n")
+            heading, block = first.lstrip("#").strip(), block.strip()
+        if not block:
+            continue
+        size = len(block.split())
+        if block_parts and words + size > max_words:
+            flush()
+        block_parts.append(block)
+        words += size
+    flush()
+    return passages
+
+
+class Passage:
+    __slots__ = ("score", "path", "heading", "text")
+
+    def __init__(self, score, path, heading, text):
+        self.score = score
+        self.path = path
+        self.heading = heading
+        self.text = text
+
+    @property
+    def source(self):
+        return f"{self.path} › {self.heading}" if self.heading else self.path
+
+
+class RetrievalIndex:
+    """
+    BM25 over passages of the notes folder.
+
+    notes.sqlite3 keeps every file's mtime/size and its passages (text plus per-passage
+    term counts). The postings are flat arrays sorted by term — passage slot (uint32) and
+    term frequency (uint16) — saved as .npy and opened memory-mapped, with terms.json
+    mapping each term to its (offset, count) run. Ingest only re-reads files whose
+    mtime or size changed; the postings are then rebuilt from the stored counts in one
+    pass. Every build goes into a fresh gen-* directory and current.json, replaced
+    last, names the live one, so a reader (or a crash) never mixes files of two
+    builds. A running app picks the new build up within `reload_every` seconds.
+    """
+
+    def __init__(self, directory, k1=1.2, b=0.75, reload_every=5.0):
+        self.k1 = k1
+        self.b = b
+        self.reload_every = reload_every
+        self._dir = directory
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, "notes.sqlite3"), check_same_thread=False, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime REAL NOT NULL, size INTEGER NOT NULL)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS passages ("
+            " id INTEGER PRIMARY KEY, path TEXT NOT NULL, heading TEXT NOT NULL, text TEXT NOT NULL,"
+            " length INTEGER NOT NULL, terms TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS passages_path ON passages (path)")
+        self._db.commit()
+        self._state = None  # (terms, docs, tfs, norm, ids), swapped as one unit on reload
+        self._loaded = None  # (mtime, generation) of the current.json we loaded
+        self._checked = 0.0
+        self._load()
+
+    def _file(self, *names):
+        return os.path.join(self._dir, *names)
+
+    # ── building ──────────────────────────────
+
+    def ingest(self, folder, max_words=120):
+        """Index new and changed notes under `folder` and forget deleted ones."""
+        seen, changed = set(), 0
+        with self._lock:
+            for root, _dirs, names in os.walk(folder):
+                for name in sorted(names):
+                    if not name.lower().endswith(NOTE_EXTENSIONS):
+                        continue
+                    path = os.path.join(root, name)
+                    rel = os.path.relpath(path, folder)
+                    info = os.stat(path)
+                    seen.add(rel)
+                    row = self._db.execute("SELECT mtime, size FROM files WHERE path = ?", (rel,)).fetchone()
+                    if row and row[0] == info.st_mtime and row[1] == info.st_size:
+                        continue
+                    with open(path, encoding="utf-8", errors="replace") as f:
+                        text = f.read()
+                    self._db.execute("DELETE FROM passages WHERE path = ?", (rel,))
+                    self._db.executemany(
+                        "INSERT INTO passages (path, heading, text, length, terms) VALUES (?, ?, ?, ?, ?)",
+                        [self._passage_row(rel, heading, body) for heading, body in split_passages(text, max_words)],
+                    )
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO files (path, mtime, size) VALUES (?, ?, ?)",
+                        (rel, info.st_mtime, info.st_size),
+                    )
+                    changed += 1
+            removed = [p for (p,) in self._db.execute("SELECT path FROM files") if p not in seen]
+            for rel in removed:
+                self._db.execute("DELETE FROM passages WHERE path = ?", (rel,))
+                self._db.execute("DELETE FROM files WHERE path = ?", (rel,))
+            self._db.commit()
+            if changed or removed or not os.path.exists(self._file("current.json")):
+                self._build()
+            passages = self._db.execute("SELECT COUNT(*) FROM passages").fetchone()[0]
+        self._load()
+        return {"changed": changed, "removed": len(removed), "passages": passages}
+
+    @staticmethod
+    def _passage_row(path, heading, body):
+        terms = tokenize(f"{heading} {body}")
+        counts = {}
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+        return path, heading, body, len(terms), json.dumps(counts, separators=(",", ":"))
+
+    def _build(self):
+        import numpy as np
+
+        ids, lengths, postings = [], [], {}
+        for slot, (pid, length, terms) in enumerate(self._db.execute("SELECT id, length, terms FROM passages ORDER BY id")):
+            ids.append(pid)
+            lengths.append(length)
+            for term, tf in json.loads(terms).items():
+                postings.setdefault(term, []).append((slot, tf))
+
+        table, docs, tfs = {}, [], []
+        for term in sorted(postings):
+            entries = postings[term]
+            table[term] = (len(docs), len(entries))
+            docs.extend(slot for slot, _ in entries)
+            tfs.extend(min(tf, 65535) for _, tf in entries)
+
+        # a new generation directory, made durable before the one-rename switch of
+        # current.json; readers keep their old mappings until they reload
+        previous = self._current()
+        generation = f"gen-{time.time_ns()}"
+        os.makedirs(self._file(generation))
+        arrays = {
+            "ids": np.asarray(ids, dtype=np.int64),
+            "lengths": np.asarray(lengths, dtype=np.float32),
+            "docs": np.asarray(docs, dtype=np.uint32),
+            "tfs": np.asarray(tfs, dtype=np.uint16),
+        }
+        for name, array in arrays.items():
+            with open(self._file(generation, f"{name}.npy"), "wb") as f:
+                np.save(f, array)
+                f.flush()
+                os.fsync(f.fileno())
+        avgdl = float(arrays["lengths"].mean()) if ids else 0.0
+        with open(self._file(generation, "terms.json"), "w", encoding="utf-8") as f:
+            json.dump({"avgdl": avgdl, "terms": table}, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self._file("current.tmp.json"), "w", encoding="utf-8") as f:
+            json.dump({"generation": generation, "built": time.time()}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self._file("current.tmp.json"), self._file("current.json"))
+
+        # keep the build just replaced (a reader may be opening it right now), drop older
+        # ones and the single-directory files of indexes built before generations
+        for name in os.listdir(self._dir):
+            if name.startswith("gen-") and name not in (generation, previous):
+                shutil.rmtree(self._file(name), ignore_errors=True)
+            elif name in ("ids.npy", "lengths.npy", "docs.npy", "tfs.npy", "terms.json"):
+                os.remove(self._file(name))
+
+    def _current(self):
+        """Name of the live generation directory, or None before the first build."""
+        try:
+            with open(self._file("current.json"), encoding="utf-8") as f:
+                return json.load(f)["generation"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    # ── searching ─────────────────────────────
+
+    def _load(self):
+        try:
+            mtime = os.stat(self._file("current.json")).st_mtime
+        except OSError:
+            return
+        if self._loaded and mtime == self._loaded[0]:
+            return
+        generation = self._current()
+        if generation is None or (self._loaded and generation == self._loaded[1]):
+            return
+        import numpy as np
+
+        try:
+            with open(self._file(generation, "terms.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            ids = np.load(self._file(generation, "ids.npy"), mmap_mode="r")
+            lengths = np.load(self._file(generation, "lengths.npy"))
+            docs = np.load(self._file(generation, "docs.npy"), mmap_mode="r")
+            tfs = np.load(self._file(generation, "tfs.npy"), mmap_mode="r")
+        except (OSError, ValueError):
+            return  # pruned by a newer build while we looked; the next check picks that one up
+        avgdl = meta["avgdl"] or 1.0
+        # the length part of BM25's denominator, precomputed per passage
+        norm = (self.k1 * (1 - self.b + self.b * lengths / avgdl)).astype(np.float32)
+        self._state = (meta["terms"], docs, tfs, norm, ids)
+        self._loaded = (mtime, generation)
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked > self.reload_every:
+            self._checked = now
+            self._load()
+
+    def __len__(self):
+        return len(self._state[4]) if self._state else 0
+
+    def top_ids(self, query, k=5):
+        """(passage id, score) of the best `k` passages — the pure index part of a search."""
+        import numpy as np
+
+        self._maybe_reload()
+        state = self._state
+        if state is None or not len(state[4]):
+            return []
+        terms, all_docs, all_tfs, norm, ids = state
+        docs_total = len(ids)
+        scores = None
+        for term in set(tokenize(query)):
+            entry = terms.get(term)
+            if entry is None:
+                continue
+            offset, count = entry
+            docs = all_docs[offset:offset + count]
+            tf = all_tfs[offset:offset + count].astype(np.float32)
+            idf = math.log(1 + (docs_total - count + 0.5) / (count + 0.5))
+            if scores is None:
+                scores = np.zeros(docs_total, dtype=np.float32)
+            # a term occurs once per passage in its run, so plain fancy-index += is safe
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm[docs])
+        if scores is None:
+            return []
+        k = min(k, docs_total)
+        best = np.argpartition(-scores, k - 1)[:k] if k < docs_total else np.arange(docs_total)
+        best = best[np.argsort(-scores[best])]
+        return [(int(ids[slot]), float(scores[slot])) for slot in best if scores[slot] > 0]
+
+    def search(self, query, k=5):
+        """Top `k` passages for `query`, best first."""
+        hits = self.top_ids(query, k)
+        if not hits:
+            return []
+        ids = [pid for pid, _ in hits]
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT id, path, heading, text FROM passages WHERE id IN ({','.join('?' * len(ids))})", ids
+            ).fetchall()
+        by_id = {row[0]: row[1:] for row in rows}
+        return [Passage(score, *by_id[pid]) for (_, score), pid in zip(hits, ids) if pid in by_id]
+
+
+def extractive_answer(query, passages, max_sentences=4):
+    """An answer stitched from the passage sentences that share the most terms with `query`."""
+    terms = set(tokenize(query))
+    candidates = []
+    for rank, passage in enumerate(passages):
+        for position, sentence in enumerate(_SENTENCE.split(re.sub(r"\s+", " ", passage.text))):
+            overlap = len(terms & set(tokenize(sentence)))
+            if overlap:
+                candidates.append((overlap, -rank, -position, sentence.strip(), passage))
+    if not candidates:
+        return None
+    best = sorted(candidates, reverse=True)[:max_sentences]
+    best.sort(key=lambda c: (-c[1], -c[2]))  # back into reading order
+    sources = []
+    for candidate in best:
+        if candidate[4].source not in sources:
+            sources.append(candidate[4].source)
+    return " ".join(c[3] for c in best) + "\n\n_From your notes: " + "; ".join(sources) + "_"
+
+
+def grounding_notes(passages, budget=300):
+    """Reference block for the model prompt, cut to roughly `budget` tokens."""
+    lines, used = [], 0
+    for i, passage in enumerate(passages, 1):
+        text = re.sub(r"\s+", " ", passage.text)
+        room = budget - used
+        if room <= 20:
+            break
+        if estimate_tokens(text) > room:
+            text = text[: room * 4].rsplit(" ", 1)[0] + "…"
+        lines.append(f"[{i}] {passage.heading or passage.path}: {text}")
+        used += estimate_tokens(lines[-1])
+    if not lines:
+        return ""
+    return "Reference notes (use them if they are relevant):\n" + "\n".join(lines)
+
+
+@st.cache_resource
+def get_retrieval_index():
+    """Process-wide index; the notes folder (CORPUS_DIR) is re-scanned incrementally on start."""
+    index = RetrievalIndex(os.path.dirname(data_path("retrieval", "notes.sqlite3")))
+    if os.path.isdir(CORPUS_DIR):
+        index.ingest(CORPUS_DIR)
+    return index
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="BiovynAI notes index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    ingest = sub.add_parser("ingest", help="(re)index a folder of .md/.txt notes")
+    ingest.add_argument("folder", nargs="?", default=CORPUS_DIR)
+    search = sub.add_parser("search", help="show the top passages for a question")
+    search.add_argument("query")
+    search.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    index = RetrievalIndex(os.path.dirname(data_path("retrieval", "notes.sqlite3")))
+    if args.command == "ingest":
+        print(index.ingest(args.folder))
+    else:
+        for passage in index.search(args.query, args.k):
+            print(f"{passage.score:6.2f}  {passage.source}\n        {passage.text[:160]!r}")
+        print(extractive_answer(args.query, index.search(args.query, args.k)) or "(no match)")
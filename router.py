@@ -0,0 +1,166 @@
+# router.py — per-backend circuit breakers + background health probe
+import logging
+import threading
+import time
+from collections import deque
+
+import streamlit as st
+
+from config import get_setting
+from transport import get_http_session, timeout
+
+log = logging.getLogger("biovyn.router")
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+
+class CircuitBreaker:
+    """
+    Classic three-state breaker.
+    - closed: requests flow; `failure_threshold` consecutive failures open it.
+    - open: requests are skipped immediately until `reset_timeout` has passed.
+    - half-open: one trial request is let through; success closes, failure re-opens.
+    """
+
+    def __init__(self, name, failure_threshold=3, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.transitions = deque(maxlen=20)  # (timestamp, old, new, reason)
+        self._opened_at = 0.0
+        self._trial_started = None
+        self._lock = threading.Lock()
+
+    def _move(self, new_state, reason):
+        if new_state == self.state:
+            return
+        self.transitions.append((time.time(), self.state, new_state, reason))
+        log.warning("breaker %s: %s -> %s (%s)", self.name, self.state, new_state, reason)
+        self.state = new_state
+        if new_state == OPEN:
+            self._opened_at = time.monotonic()
+        self._trial_started = None
+
+    def allow(self):
+        """True if a request may be sent now (may consume the half-open trial slot)."""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN and now - self._opened_at >= self.reset_timeout:
+                self._move(HALF_OPEN, "reset timeout elapsed")
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN:
+                # a trial that never reported back (e.g. abandoned stream) doesn't block forever
+                if self._trial_started is None or now - self._trial_started >= self.reset_timeout:
+                    self._trial_started = now
+                    return True
+            return False
+
+    def is_available(self):
+        """Non-consuming check, for cheap side calls (embeddings, warm-ups)."""
+        return self.state != OPEN
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._move(CLOSED, "request succeeded")
+
+    def record_failure(self, reason="request failed"):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self._move(OPEN, reason)
+
+    # health-probe hooks: a failed probe opens at once, a good one lets traffic try again
+    def probe_failed(self, reason):
+        with self._lock:
+            self._move(OPEN, f"health probe: {reason}")
+
+    def probe_succeeded(self):
+        with self._lock:
+            if self.state == OPEN:
+                self._move(HALF_OPEN, "health probe ok")
+
+
+class BackendRouter:
+    """
+    Holds one breaker per backend and probes the local Ollama host in the background.
+    `overrides` maps a backend to its own breaker settings, e.g. {"llava": {"reset_timeout": 120}}.
+    """
+
+    def __init__(self, ollama_url, probe_interval=5.0, failure_threshold=3, reset_timeout=30.0, overrides=None):
+        base = ollama_url.rsplit("/api/", 1)[0]
+        self.probe_url = f"{base}/api/tags"
+        self.probe_interval = probe_interval
+        # "ollama" = chat model, "llava" = diagram model; both live on the probed host
+        defaults = {"failure_threshold": failure_threshold, "reset_timeout": reset_timeout}
+        self.breakers = {
+            name: CircuitBreaker(name, **{**defaults, **(overrides or {}).get(name, {})})
+            for name in ("ollama", "llava", "openai")
+        }
+        self._probed = ("ollama", "llava")
+        # a reachable host says nothing about a slow llava, so only the chat model is
+        # let back early by the probe; llava waits out its own reset timeout
+        self._probe_recovers = ("ollama",)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def allow(self, backend):
+        return self.breakers[backend].allow()
+
+    def is_available(self, backend):
+        return self.breakers[backend].is_available()
+
+    def record_success(self, backend):
+        self.breakers[backend].record_success()
+
+    def record_failure(self, backend, reason="request failed"):
+        self.breakers[backend].record_failure(reason)
+
+    def probe_once(self):
+        try:
+            resp = get_http_session().get(self.probe_url, timeout=timeout(2))
+            ok, reason = resp.status_code == 200, f"HTTP {resp.status_code}"
+        except Exception as e:
+            ok, reason = False, type(e).__name__
+        for name in self._probed:
+            if not ok:
+                self.breakers[name].probe_failed(reason)
+            elif name in self._probe_recovers:
+                self.breakers[name].probe_succeeded()
+        return ok
+
+    def start(self):
+        if self._thread is None and self.probe_interval > 0:
+            self._thread = threading.Thread(target=self._probe_loop, name="biovyn-health-probe", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _probe_loop(self):
+        while not self._stop.is_set():
+            self.probe_once()
+            self._stop.wait(self.probe_interval)
+
+    def snapshot(self):
+        return {name: breaker.state for name, breaker in self.breakers.items()}
+
+
+@st.cache_resource
+def get_router():
+    """Process-wide router; the health probe thread is started once."""
+    router = BackendRouter(
+        get_setting("OLLAMA_URL", "http://localhost:11434/api/generate"),
+        probe_interval=get_setting("HEALTH_PROBE_INTERVAL", 5.0, float),
+        failure_threshold=get_setting("BREAKER_FAILURE_THRESHOLD", 3, int),
+        reset_timeout=get_setting("BREAKER_RESET_TIMEOUT", 30.0, float),
+        overrides={"llava": {
+            "failure_threshold": get_setting("LLAVA_BREAKER_FAILURE_THRESHOLD", 5, int),
+            "reset_timeout": get_setting("LLAVA_BREAKER_RESET_TIMEOUT", 120.0, float),
+        }},
+    )
+    return router.start()
@@ -0,0 +1,196 @@
+# scheduler.py — admission control for upstream LLM calls: backend limits, per-session rates, fair queue
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+import streamlit as st
+
+from config import get_setting
+
+
+class Busy(Exception):
+    """Raised instead of waiting when we're saturated; `retry_after` is a hint in seconds."""
+
+    def __init__(self, message, retry_after=5.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """`rate` tokens per second, holding at most `capacity` (the allowed burst)."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self):
+        """0.0 if a token was taken, else the seconds until one will be available."""
+        self._refill(time.monotonic())
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def refund(self):
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def full(self):
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+
+class FairQueue:
+    """
+    Bounded wait queue that dispatches round-robin across sessions, so one session
+    with many questions queued can't starve the others. `put` raises Busy when full.
+    """
+
+    def __init__(self, max_size=32):
+        self.max_size = max_size
+        self._queues = OrderedDict()  # session -> deque of items; order is the rotation
+        self._size = 0
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return self._size
+
+    def put(self, session, item):
+        with self._cond:
+            if self._size >= self.max_size:
+                raise Busy("BiovynAI is answering lots of questions right now", retry_after=10.0)
+            self._queues.setdefault(session, deque()).append(item)
+            self._size += 1
+            self._cond.notify()
+
+    def requeue(self, session, item):
+        """Put an already admitted item back at the front of its session's line (never Busy)."""
+        with self._cond:
+            if session not in self._queues:
+                self._queues[session] = deque()
+                self._queues.move_to_end(session, last=False)
+            self._queues[session].appendleft(item)
+            self._size += 1
+            self._cond.notify()
+
+    def get(self):
+        """Block until an item is queued; takes from the session at the head of the rotation."""
+        with self._cond:
+            while not self._size:
+                self._cond.wait()
+            session, items = next(iter(self._queues.items()))
+            item = items.popleft()
+            if items:
+                self._queues.move_to_end(session)
+            else:
+                del self._queues[session]
+            self._size -= 1
+            return item
+
+    def position(self, session, item):
+        """1-based dispatch position of a queued item, or None once it has left the queue."""
+        with self._cond:
+            items = self._queues.get(session)
+            if not items or item not in items:
+                return None
+            index = items.index(item)
+            ahead, before_us = index, True
+            # our item goes out in round `index`: sessions ahead of us in the rotation get
+            # `index + 1` turns before it, the ones behind us `index`
+            for other, queued in self._queues.items():
+                if other == session:
+                    before_us = False
+                else:
+                    ahead += min(len(queued), index + 1 if before_us else index)
+            return ahead + 1
+
+
+class RateLimiter:
+    """Per-session token buckets; buckets that have refilled are forgotten."""
+
+    def __init__(self, per_minute=6, burst=3, max_buckets=2000):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.max_buckets = max_buckets
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, session):
+        with self._lock:
+            bucket = self._buckets.get(session)
+            if bucket is None:
+                if len(self._buckets) >= self.max_buckets:
+                    self._buckets = {k: b for k, b in self._buckets.items() if not b.full()}
+                bucket = self._buckets[session] = TokenBucket(self.rate, self.burst)
+            wait = bucket.take()
+        if wait:
+            raise Busy("You're asking faster than BiovynAI can keep up", retry_after=wait)
+
+    def refund(self, session):
+        with self._lock:
+            bucket = self._buckets.get(session)
+            if bucket is not None:
+                bucket.refund()
+
+
+class BackendLimiter:
+    """
+    Caps concurrent upstream calls per backend. A call that can't get a slot within
+    `wait` seconds raises Busy, which the backend chain treats as "try the next one".
+    Keep `wait` short: the caller is a shared generation worker, and holding it here
+    starves the pool exactly when the backends are saturated.
+    """
+
+    def __init__(self, limits, wait=1.5):
+        self.wait = wait
+        self.limits = dict(limits)
+        self.active = {name: 0 for name in limits}
+        self._slots = {name: threading.BoundedSemaphore(n) for name, n in limits.items() if n > 0}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, backend, wait=None):
+        """Hold one of `backend`'s slots; `wait` overrides how long to wait for it."""
+        slots = self._slots.get(backend)
+        if slots is None:
+            yield
+            return
+        if not slots.acquire(timeout=self.wait if wait is None else wait):
+            raise Busy(f"{backend} is at its concurrency limit", retry_after=self.wait)
+        with self._lock:
+            self.active[backend] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.active[backend] -= 1
+            slots.release()
+
+    def snapshot(self):
+        with self._lock:
+            return {name: (self.active[name], self.limits[name]) for name in self.limits}
+
+
+@st.cache_resource
+def get_backend_limiter():
+    """
+    Process-wide per-backend limits (0 = unlimited). llava shares the Ollama server's
+    limit; diagram prefetches additionally hold a "prefetch" slot, so speculative work
+    never takes more than its share of Ollama.
+    """
+    return BackendLimiter(
+        {
+            "ollama": get_setting("OLLAMA_CONCURRENCY", 2, int),
+            "openai": get_setting("OPENAI_CONCURRENCY", 8, int),
+            "prefetch": get_setting("DIAGRAM_PREFETCH_CONCURRENCY", 1, int),
+        },
+        wait=get_setting("BACKEND_SLOT_WAIT", 1.5, float),
+    )
@@ -0,0 +1,168 @@
+# semantic_cache.py — optional near-duplicate answer cache over local Ollama embeddings
+import os
+import sqlite3
+import threading
+import time
+
+import streamlit as st
+
+from config import data_path, get_setting
+from transport import get_http_session, timeout
+
+_OLLAMA_BASE = get_setting("OLLAMA_URL", "http://localhost:11434/api/generate").rsplit("/api/", 1)[0]
+EMBED_URL = get_setting("OLLAMA_EMBED_URL", f"{_OLLAMA_BASE}/api/embed")
+EMBED_MODEL = get_setting("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+
+
+class SemanticCache:
+    """
+    Answers keyed by prompt embedding instead of exact text.
+
+    Vectors live in a fixed-capacity float32 matrix stored as a .npy file and opened
+    memory-mapped, so lookups are one matrix product against the whole index. Slot
+    metadata (namespace, prompt, answer, last use) lives in SQLite next to it. When the
+    index is full the least recently used slot is overwritten.
+    Namespaces keep e.g. study-mode answers apart from normal answers.
+    """
+
+    def __init__(self, directory, threshold=0.9, capacity=2000):
+        # numpy is only imported once the (optional) semantic cache is actually used
+        import numpy as np
+
+        self.threshold = threshold
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._dir = directory
+        self._lock = threading.Lock()
+        self._vectors = None  # (capacity, dim) memmap, created on the first add
+        self._db = sqlite3.connect(os.path.join(directory, "semantic.sqlite3"), check_same_thread=False, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS slots ("
+            " slot INTEGER PRIMARY KEY, namespace TEXT NOT NULL, prompt TEXT NOT NULL,"
+            " answer TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.commit()
+
+        # per-slot namespace id (-1 = empty) and last-use time, mirrored in memory for masking/eviction
+        self._slot_ns = np.full(capacity, -1, dtype=np.int32)
+        self._last_used = np.zeros(capacity, dtype=np.float64)
+        self._ns_ids = {}
+        vectors_path = self._vectors_path()
+        if os.path.exists(vectors_path):
+            self._vectors = np.load(vectors_path, mmap_mode="r+")
+            if self._vectors.shape[0] != capacity:
+                # capacity changed between runs — start over rather than reshuffle slots
+                self._vectors = None
+                os.remove(vectors_path)
+                self._db.execute("DELETE FROM slots")
+                self._db.commit()
+        for slot, namespace, last_used in self._db.execute("SELECT slot, namespace, last_used FROM slots"):
+            if slot < capacity:
+                self._slot_ns[slot] = self._namespace_id(namespace)
+                self._last_used[slot] = last_used
+
+    def _vectors_path(self):
+        return os.path.join(self._dir, "semantic_vectors.npy")
+
+    def _namespace_id(self, namespace):
+        return self._ns_ids.setdefault(namespace, len(self._ns_ids))
+
+    @staticmethod
+    def namespace(study_mode, model, split_modes=True):
+        mode = ("study" if study_mode else "normal") if split_modes else "any"
+        return f"{model}|{mode}"
+
+    def embed(self, texts):
+        """Embed a batch of texts through Ollama; returns unit-length float32 rows."""
+        import numpy as np
+
+        resp = get_http_session().post(
+            EMBED_URL, json={"model": EMBED_MODEL, "input": list(texts)}, timeout=timeout(5)
+        )
+        resp.raise_for_status()
+        matrix = np.asarray(resp.json()["embeddings"], dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+    def search(self, queries, namespace, k=1):
+        """
+        Batched top-k cosine search restricted to one namespace.
+        `queries` is (n, dim) unit-length; returns n lists of (slot, score), best first.
+        """
+        import numpy as np
+
+        queries = np.atleast_2d(queries)
+        with self._lock:
+            if self._vectors is None or namespace not in self._ns_ids:
+                return [[] for _ in range(len(queries))]
+            mask = self._slot_ns == self._ns_ids[namespace]
+            if not mask.any():
+                return [[] for _ in range(len(queries))]
+            scores = queries @ self._vectors.T
+            scores[:, ~mask] = -np.inf
+        k = min(k, int(mask.sum()))
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in zip(scores, top):
+            order = candidates[np.argsort(-row[candidates])]
+            results.append([(int(slot), float(row[slot])) for slot in order])
+        return results
+
+    def lookup(self, vector, namespace):
+        """Stored answer for the nearest prompt if it clears the threshold, else None."""
+        best = self.search(vector, namespace, k=1)[0]
+        if not best or best[0][1] < self.threshold:
+            self.misses += 1
+            return None
+        slot = best[0][0]
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT answer FROM slots WHERE slot = ?", (slot,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._last_used[slot] = now
+            self._db.execute("UPDATE slots SET last_used = ? WHERE slot = ?", (now, slot))
+            self._db.commit()
+        self.hits += 1
+        return row[0]
+
+    def add(self, vector, prompt, answer, namespace):
+        import numpy as np
+
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        now = time.time()
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.lib.format.open_memmap(
+                    self._vectors_path(), mode="w+", dtype=np.float32, shape=(self.capacity, vector.size)
+                )
+            if vector.size != self._vectors.shape[1]:
+                # embedding model changed dimensions; ignore rather than corrupt the index
+                return
+            empty = np.flatnonzero(self._slot_ns < 0)
+            slot = int(empty[0]) if empty.size else int(np.argmin(self._last_used))
+            self._vectors[slot] = vector
+            self._vectors.flush()
+            self._slot_ns[slot] = self._namespace_id(namespace)
+            self._last_used[slot] = now
+            self._db.execute(
+                "INSERT OR REPLACE INTO slots (slot, namespace, prompt, answer, last_used) VALUES (?, ?, ?, ?, ?)",
+                (slot, namespace, prompt, answer, now),
+            )
+            self._db.commit()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": int((self._slot_ns >= 0).sum())}
+
+
+@st.cache_resource
+def get_semantic_cache():
+    directory = os.path.dirname(data_path("semantic", "semantic.sqlite3"))
+    return SemanticCache(
+        directory,
+        threshold=get_setting("SEMANTIC_CACHE_THRESHOLD", 0.92, float),
+        capacity=get_setting("SEMANTIC_CACHE_CAPACITY", 2000, int),
+    )
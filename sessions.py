@@ -0,0 +1,268 @@
+# sessions.py — bounded per-session chat history, spilled to SQLite and restorable by token
+import re
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from itertools import islice
+
+import streamlit as st
+
+from config import data_path, get_setting
+
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9_-]{16,64}")
+
+
+class Message:
+    """One chat message. Slotted to keep the in-memory tail small; indexes like the old dicts."""
+
+    __slots__ = ("seq", "role", "content", "ts")
+
+    def __init__(self, seq, role, content, ts):
+        self.seq = seq
+        self.role = role
+        self.content = content
+        self.ts = ts
+
+    def __getitem__(self, key):
+        # m["role"] / m["content"] keep working for code written against dicts
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+
+class ChatSession:
+    """
+    Read-only sequence view over one session's history, plus append/clear.
+    Every message is written through to SQLite; only the newest ones (capped by
+    count and by bytes) stay in memory, and older slices are read back on demand.
+    """
+
+    def __init__(self, store, token, count, tail):
+        self.token = token
+        self.count = count
+        self.last_seen = time.monotonic()
+        self._store = store
+        self._tail = deque(tail)
+        self._tail_bytes = sum(len(m.content) for m in tail)
+
+    def __len__(self):
+        return self.count
+
+    def __bool__(self):
+        return self.count > 0
+
+    @property
+    def tail_start(self):
+        return self.count - len(self._tail)
+
+    @property
+    def memory_bytes(self):
+        return self._tail_bytes
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.count)
+            if step != 1:
+                return list(self)[index]
+            return self.slice(start, stop)
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("message index out of range")
+        return self.slice(index, index + 1)[0]
+
+    def slice(self, start, stop):
+        """Messages [start, stop) — from the memory tail when possible, else from disk."""
+        with self._store._lock:
+            first = self.tail_start
+            if stop <= start:
+                return []
+            if start >= first:
+                return list(islice(self._tail, start - first, stop - first))
+            older = self._store._load(self.token, start, min(stop, first))
+            if stop > first:
+                older.extend(islice(self._tail, 0, stop - first))
+            return older
+
+    def __iter__(self):
+        """Whole history, oldest first, paged from disk so long chats are never held at once."""
+        return self.iter_from(0)
+
+    def iter_from(self, start, page=200):
+        with self._store._lock:
+            first, tail = self.tail_start, list(self._tail)
+        while start < first:
+            stop = min(first, start + page)
+            with self._store._lock:
+                rows = self._store._load(self.token, start, stop)
+            yield from rows
+            start = stop
+        yield from tail[max(0, start - first):]
+
+    def append(self, role, content):
+        store = self._store
+        with store._lock:
+            message = Message(self.count, role, content, time.time())
+            store._write(self.token, message)
+            self.count += 1
+            self._tail.append(message)
+            self._tail_bytes += len(content)
+            # per-session memory cap: the newest message always stays
+            while len(self._tail) > 1 and (
+                len(self._tail) > store.tail_messages or self._tail_bytes > store.tail_bytes
+            ):
+                self._tail_bytes -= len(self._tail.popleft().content)
+            self.last_seen = time.monotonic()
+            return message
+
+    def clear(self):
+        with self._store._lock:
+            self._store._delete(self.token)
+            self.count = 0
+            self._tail.clear()
+            self._tail_bytes = 0
+
+
+class SessionStore:
+    """
+    Process-wide registry of chat sessions. Sessions idle for `idle_seconds`, or
+    beyond the `max_sessions` most recently used, are dropped from memory (their
+    history stays on disk and comes back when the token reconnects); sessions
+    untouched for `retention` seconds are deleted from disk as well.
+    """
+
+    def __init__(self, path, tail_messages=40, tail_bytes=64 * 1024, idle_seconds=1800,
+                 max_sessions=500, retention=30 * 24 * 3600):
+        self.tail_messages = tail_messages
+        self.tail_bytes = tail_bytes
+        self.idle_seconds = idle_seconds
+        self.max_sessions = max_sessions
+        self.retention = retention
+        self._sessions = OrderedDict()  # token -> ChatSession, least recently used first
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            " session TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL,"
+            " ts REAL NOT NULL, PRIMARY KEY (session, seq)) WITHOUT ROWID"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (token TEXT PRIMARY KEY, created REAL NOT NULL, active REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_active ON sessions (active)")
+        self._db.commit()
+        self.purge()
+
+    @staticmethod
+    def new_token():
+        return secrets.token_urlsafe(18)
+
+    @staticmethod
+    def valid_token(token):
+        return bool(token) and TOKEN_PATTERN.fullmatch(token) is not None
+
+    def open(self, token):
+        """The session for `token`, restored from disk if it isn't in memory."""
+        with self._lock:
+            self._evict_idle()
+            session = self._sessions.get(token)
+            if session is None:
+                count = self._db.execute("SELECT COUNT(*) FROM messages WHERE session = ?", (token,)).fetchone()[0]
+                tail = self._load(token, max(0, count - self.tail_messages), count)
+                while len(tail) > 1 and sum(len(m.content) for m in tail) > self.tail_bytes:
+                    tail.pop(0)
+                session = self._sessions[token] = ChatSession(self, token, count, tail)
+            self._sessions.move_to_end(token)
+            session.last_seen = time.monotonic()
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return session
+
+    def _evict_idle(self):
+        cutoff = time.monotonic() - self.idle_seconds
+        while self._sessions:
+            token, session = next(iter(self._sessions.items()))
+            if session.last_seen >= cutoff:
+                break
+            del self._sessions[token]
+
+    def _load(self, token, start, stop):
+        rows = self._db.execute(
+            "SELECT seq, role, content, ts FROM messages WHERE session = ? AND seq >= ? AND seq < ? ORDER BY seq",
+            (token, start, stop),
+        ).fetchall()
+        return [Message(*row) for row in rows]
+
+    def _write(self, token, message):
+        self._db.execute(
+            "INSERT OR REPLACE INTO messages (session, seq, role, content, ts) VALUES (?, ?, ?, ?, ?)",
+            (token, message.seq, message.role, message.content, message.ts),
+        )
+        self._db.execute(
+            "INSERT INTO sessions (token, created, active) VALUES (?, ?, ?)"
+            " ON CONFLICT(token) DO UPDATE SET active = excluded.active",
+            (token, message.ts, message.ts),
+        )
+        self._db.commit()
+
+    def _delete(self, token):
+        self._db.execute("DELETE FROM messages WHERE session = ?", (token,))
+        self._db.execute("DELETE FROM sessions WHERE token = ?", (token,))
+        self._db.commit()
+
+    def tokens(self):
+        """(token, created, active) for every stored session with messages, oldest activity first."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT token, created, active FROM sessions"
+                " WHERE EXISTS (SELECT 1 FROM messages WHERE session = token) ORDER BY active"
+            ).fetchall()
+
+    def iter_messages(self, token, page=200):
+        """Page through a stored session without pulling it into the in-memory registry."""
+        start = 0
+        while True:
+            with self._lock:
+                rows = self._load(token, start, start + page)
+            yield from rows
+            if len(rows) < page:
+                return
+            start += page
+
+    def purge(self):
+        """Delete sessions (and their messages) not active within `retention` seconds."""
+        with self._lock:
+            cutoff = time.time() - self.retention
+            stale = [row[0] for row in self._db.execute("SELECT token FROM sessions WHERE active < ?", (cutoff,))]
+            for token in stale:
+                self._sessions.pop(token, None)
+                self._db.execute("DELETE FROM messages WHERE session = ?", (token,))
+                self._db.execute("DELETE FROM sessions WHERE token = ?", (token,))
+            self._db.commit()
+            return len(stale)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions_in_memory": len(self._sessions),
+                "messages_in_memory": sum(len(s._tail) for s in self._sessions.values()),
+                "memory_bytes": sum(s.memory_bytes for s in self._sessions.values()),
+            }
+
+
+@st.cache_resource
+def get_session_store():
+    """Process-wide session store shared by every Streamlit session."""
+    return SessionStore(
+        data_path("sessions.sqlite3"),
+        tail_messages=get_setting("SESSION_TAIL_MESSAGES", 40, int),
+        tail_bytes=get_setting("SESSION_TAIL_KB", 64, int) * 1024,
+        idle_seconds=get_setting("SESSION_IDLE_SECONDS", 1800, float),
+        max_sessions=get_setting("SESSION_MAX_IN_MEMORY", 500, int),
+        retention=get_setting("SESSION_RETENTION_DAYS", 30, float) * 24 * 3600,
+    )
@@ -0,0 +1,68 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from hedging import HedgedRace, HedgePolicy, LatencyTracker, abort_on_cancel
+
+
+def make_policy(**kwargs):
+    kwargs.setdefault("default_budget", 0.05)
+    kwargs.setdefault("min_samples", 10_000)  # always use the default budget
+    return HedgePolicy(LatencyTracker(), **kwargs)
+
+
+def test_per_minute_cap_holds_across_interleaved_requests():
+    policy = make_policy(max_per_minute=3, max_fraction=1.0)
+    requests = [policy.note_request() for _ in range(30)]
+    granted = [policy.try_hedge(request) for request in requests]
+    assert sum(granted) == 3
+
+
+def test_fraction_cap_counts_every_hedge():
+    policy = make_policy(max_per_minute=100, max_fraction=0.2)
+    requests = [policy.note_request() for _ in range(30)]
+    assert sum(policy.try_hedge(request) for request in requests) == 6
+
+
+def test_a_request_is_hedged_at_most_once():
+    policy = make_policy(max_per_minute=10, max_fraction=1.0)
+    request = policy.note_request()
+    assert policy.try_hedge(request)
+    assert not policy.try_hedge(request)
+
+
+def slow_primary():
+    time.sleep(0.3)
+    yield "primary"
+
+
+def fast_secondary():
+    yield "secondary"
+
+
+def test_concurrent_races_respect_the_cap():
+    policy = make_policy(max_per_minute=3, max_fraction=1.0)
+    races = [HedgedRace(("ollama", slow_primary), ("openai", fast_secondary), policy, ThreadPoolExecutor(4))
+             for _ in range(10)]
+    with ThreadPoolExecutor(len(races)) as runners:
+        answers = list(runners.map(lambda race: "".join(race()), races))
+
+    assert sum(race.hedged for race in races) == 3
+    assert answers.count("secondary") == 3
+    assert answers.count("primary") == 7
+
+
+def test_losing_stream_is_interrupted_while_waiting():
+    released = threading.Event()
+
+    def stuck_primary():
+        unblock = threading.Event()
+        with abort_on_cancel(unblock.set):
+            unblock.wait(10)  # stands in for a read blocked on the socket
+        released.set()
+        yield "primary"
+
+    race = HedgedRace(("ollama", stuck_primary), ("openai", fast_secondary),
+                      make_policy(max_per_minute=10, max_fraction=1.0), ThreadPoolExecutor(2))
+    assert "".join(race()) == "secondary"
+    assert released.wait(1)
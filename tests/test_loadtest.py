@@ -0,0 +1,31 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import loadtest  # noqa: E402
+
+
+def test_concurrent_sessions_complete_every_turn():
+    args = loadtest.build_parser().parse_args(
+        ["--sessions", "2", "--turns", "2", "--port", "0", "--latency", "0.05", "--timeout", "90"]
+    )
+    report = loadtest.run(args)
+
+    assert report["errors"] == []
+    assert report["turns_completed"] == 4
+    assert report["turns_rejected"] == 0
+    assert report["diagram"]["n"] == 2
+
+
+def test_rate_limited_turns_are_counted_as_rejected():
+    args = loadtest.build_parser().parse_args(
+        ["--sessions", "1", "--turns", "3", "--port", "0", "--latency", "0.05", "--no-diagram",
+         "--burst", "1", "--rate-per-minute", "1"]
+    )
+    report = loadtest.run(args)
+
+    assert report["errors"] == []
+    assert report["turns_completed"] == 1
+    assert report["turns_rejected"] == 2
+    assert report["latency"]["n"] == 1
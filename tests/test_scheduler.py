@@ -0,0 +1,73 @@
+import time
+
+import pytest
+
+from jobs import JobManager
+from scheduler import BackendLimiter, Busy, FairQueue, RateLimiter
+
+
+def filled_queue():
+    queue = FairQueue(max_size=10)
+    for session, item in [("a", "a1"), ("a", "a2"), ("a", "a3"), ("b", "b1"), ("c", "c1")]:
+        queue.put(session, item)
+    return queue
+
+
+def test_fair_queue_dispatches_round_robin_across_sessions():
+    queue = filled_queue()
+    assert [queue.get() for _ in range(5)] == ["a1", "b1", "c1", "a2", "a3"]
+    assert len(queue) == 0
+
+
+def test_fair_queue_position_matches_dispatch_order():
+    queue = filled_queue()
+    positions = {item: queue.position(session, item)
+                 for session, item in [("a", "a1"), ("a", "a2"), ("a", "a3"), ("b", "b1"), ("c", "c1")]}
+    assert positions == {"a1": 1, "b1": 2, "c1": 3, "a2": 4, "a3": 5}
+
+    queue.get()
+    assert queue.position("a", "a1") is None
+    assert queue.position("a", "a2") == 3
+
+
+def test_fair_queue_rejects_when_full_but_requeue_always_fits():
+    queue = FairQueue(max_size=1)
+    queue.put("a", "a1")
+    with pytest.raises(Busy):
+        queue.put("b", "b1")
+
+    queue.requeue("b", "b0")
+    assert len(queue) == 2
+    assert queue.get() == "b0"  # back at the front of the line
+
+
+def test_queue_full_refunds_the_rate_limit_token():
+    limiter = RateLimiter(per_minute=0.001, burst=2)
+    jobs = JobManager(max_workers=0, queue_size=1, rate_limiter=limiter)
+    jobs.submit("What is mitochondria?", session="s")
+    with pytest.raises(Busy):
+        jobs.submit("Explain photosynthesis", session="s")
+
+    assert jobs.rejected == 1
+    limiter.take("s")  # the rejected submit's token came back
+    with pytest.raises(Busy):
+        limiter.take("s")
+
+
+def test_backend_slot_times_out_with_busy():
+    limiter = BackendLimiter({"ollama": 1, "openai": 0}, wait=0.05)
+    with limiter.slot("ollama"):
+        assert limiter.snapshot()["ollama"] == (1, 1)
+        started = time.monotonic()
+        with pytest.raises(Busy):
+            with limiter.slot("ollama"):
+                pass
+        assert time.monotonic() - started < 1
+        with pytest.raises(Busy):
+            with limiter.slot("ollama", wait=0):
+                pass
+        with limiter.slot("openai"):  # 0 = unlimited
+            pass
+    assert limiter.snapshot()["ollama"] == (0, 1)
+    with limiter.slot("ollama"):
+        pass
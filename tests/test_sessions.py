@@ -0,0 +1,60 @@
+from sessions import SessionStore
+
+
+def make_store(tmp_path, **kwargs):
+    return SessionStore(str(tmp_path / "sessions.sqlite3"), **kwargs)
+
+
+def fill(session, n, size=1):
+    for i in range(n):
+        session.append("user" if i % 2 == 0 else "assistant", f"{i}".ljust(size, "."))
+
+
+def contents(messages):
+    return [m.content.rstrip(".") for m in messages]
+
+
+def test_slices_crossing_the_tail_boundary_read_back_from_disk(tmp_path):
+    store = make_store(tmp_path, tail_messages=3)
+    session = store.open(SessionStore.new_token())
+    fill(session, 10)
+
+    assert session.tail_start == 7
+    assert contents(session[5:9]) == ["5", "6", "7", "8"]
+    assert contents(session.slice(0, 10)) == [str(i) for i in range(10)]
+    assert contents(session.iter_from(6)) == ["6", "7", "8", "9"]
+    assert session[-1].content == "9"
+    assert session[2].seq == 2
+
+
+def test_tail_is_capped_by_bytes_but_keeps_the_newest_message(tmp_path):
+    store = make_store(tmp_path, tail_messages=100, tail_bytes=250)
+    session = store.open(SessionStore.new_token())
+    fill(session, 5, size=100)
+
+    assert session.tail_start == 3
+    assert session.memory_bytes == 200
+    assert len(session) == 5
+    assert contents(session) == ["0", "1", "2", "3", "4"]
+
+    session.append("assistant", "x" * 1000)
+    assert session.tail_start == 5  # only the oversized newest message stays in memory
+    assert session.memory_bytes == 1000
+
+
+def test_cleared_session_reopens_empty(tmp_path):
+    store = make_store(tmp_path, tail_messages=3)
+    token = SessionStore.new_token()
+    session = store.open(token)
+    fill(session, 6)
+    session.clear()
+
+    reopened = make_store(tmp_path, tail_messages=3).open(token)
+    assert len(reopened) == 0
+    assert list(reopened) == []
+    assert all(row[0] != token for row in store.tokens())
+
+    reopened.append("user", "again")
+    restored = make_store(tmp_path, tail_messages=3).open(token)
+    assert contents(restored) == ["again"]
+    assert restored[0].seq == 0
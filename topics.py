@@ -0,0 +1,102 @@
+# topics.py — one compiled biology topic index shared by the app, diagrams and prefetch
+import json
+import os
+import re
+
+import streamlit as st
+
+from config import get_setting
+
+TOPICS_FILE = get_setting("TOPICS_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "topics.json"))
+
+
+class Topic:
+    __slots__ = ("id", "terms", "diagram", "priority")
+
+    def __init__(self, id, terms, diagram=None, priority=0):
+        self.id = id
+        self.terms = terms
+        self.diagram = diagram
+        self.priority = priority
+
+    def __repr__(self):
+        return f"Topic({self.id!r})"
+
+
+def _trie_regex(terms):
+    """
+    Compile the terms into one regex shaped like a trie, so matching costs one pass
+    over the text no matter how many topics there are (a flat `a|b|c|...`
+    alternation would retry every term at every position).
+    """
+    trie = {}
+    for term in terms:
+        node = trie
+        for ch in term:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # greedy optional: prefer the longer term, back off to the shorter one
+        return f"(?:{body})?" if "" in node else body
+
+    # whole words only, with simple plurals ("cells", "viruses")
+    return re.compile(r"\b(" + build(trie) + r")(?:e?s)?\b")
+
+
+class TopicIndex:
+    """
+    Maps free text to known topics via synonyms, simple plurals and word-boundary
+    matching. When several topics are mentioned, the most specific one wins:
+    explicit priority first, then the longest matched term, then the earliest.
+    """
+
+    def __init__(self, topics, default_diagram=None):
+        self.topics = {t.id: t for t in topics}
+        self.default_diagram = default_diagram
+        self._by_term = {}
+        for topic in topics:
+            for term in topic.terms:
+                self._by_term[term.lower()] = topic
+        self._regex = _trie_regex(self._by_term)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        topics = [
+            Topic(t["id"], t.get("terms") or [t["id"]], t.get("diagram"), t.get("priority", 0))
+            for t in data["topics"]
+        ]
+        return cls(topics, data.get("default_diagram"))
+
+    def find_all(self, text):
+        """(topic, matched term, position) for every mention, left to right."""
+        return [(self._by_term[m.group(1)], m.group(1), m.start()) for m in self._regex.finditer(text.lower())]
+
+    def mentions(self, text):
+        return self._regex.search(text.lower()) is not None
+
+    def best(self, text, require_diagram=False):
+        """Most specific topic mentioned in `text` (optionally only topics with a diagram)."""
+        best, best_rank = None, None
+        for topic, term, pos in self.find_all(text):
+            if require_diagram and not topic.diagram:
+                continue
+            rank = (topic.priority, len(term), -pos)
+            if best_rank is None or rank > best_rank:
+                best, best_rank = topic, rank
+        return best
+
+    def diagram_topics(self):
+        return [t for t in self.topics.values() if t.diagram]
+
+
+@st.cache_resource
+def get_topic_index():
+    """Built once per process from TOPICS_FILE."""
+    return TopicIndex.from_file(TOPICS_FILE)
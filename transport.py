@@ -0,0 +1,111 @@
+# transport.py — shared, pooled HTTP transport for the Ollama and OpenAI backends
+import streamlit as st
+
+from config import get_setting
+
+POOL_SIZE = get_setting("HTTP_POOL_SIZE", 20, int)
+CONNECT_TIMEOUT = get_setting("HTTP_CONNECT_TIMEOUT", 3.05, float)
+READ_TIMEOUT = get_setting("HTTP_READ_TIMEOUT", 10, float)
+RETRIES = get_setting("HTTP_RETRIES", 2, int)
+BACKOFF = get_setting("HTTP_BACKOFF", 0.3, float)
+
+
+def timeout(read=None):
+    """(connect, read) timeout tuple for requests; `read` overrides the default read timeout."""
+    return (CONNECT_TIMEOUT, READ_TIMEOUT if read is None else read)
+
+
+def abort(response):
+    """
+    Cut off a streaming requests/httpx response from another thread. Closing it there
+    doesn't wake a reader blocked on the socket, so shut the socket down instead: the
+    reader fails straight away and closes the response on its own way out.
+    """
+    import socket
+
+    try:
+        sock = response.raw.connection.sock  # requests (urllib3)
+    except AttributeError:
+        stream = getattr(response, "extensions", {}).get("network_stream")  # httpx
+        sock = stream.get_extra_info("socket") if stream is not None else None
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass  # already closed
+
+
+@st.cache_resource
+def get_http_session():
+    """
+    One keep-alive, connection-pooled requests.Session per process, shared by every
+    Streamlit session. Retries only connection errors and 502/503/504 (with backoff) —
+    never a read timeout, otherwise a slow model would cost us the timeout twice.
+    """
+    # imported on first use so importing the app doesn't pay for them up front
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(
+        total=RETRIES,
+        connect=RETRIES,
+        read=0,
+        status=RETRIES,
+        backoff_factor=BACKOFF,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET", "POST"}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+@st.cache_resource
+def _get_httpx_client():
+    """Pooled httpx client the OpenAI SDK sends its requests through."""
+    try:
+        # newer openai SDKs build on the httpx2 fork; older ones on httpx
+        import httpx2 as httpx
+    except ImportError:
+        import httpx
+    return httpx.Client(
+        limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE),
+        timeout=httpx.Timeout(get_setting("OPENAI_READ_TIMEOUT", 60, float), connect=CONNECT_TIMEOUT),
+    )
+
+
+class _ImageStub:
+    # provide a lightweight stub object with generate() that returns a safe empty payload
+    def generate(self, *args, **kwargs):
+        # Return a structure similar to successful response but with empty image
+        return {"data": [{"b64_json": None}]}
+
+
+@st.cache_resource
+def get_openai_client(allow_images=False):
+    """
+    Shared OpenAI client (or None if the SDK or API key is missing).
+    Unless allow_images=True, image generation is stubbed out so *no* image call can
+    ever reach OpenAI, preventing billing errors.
+    """
+    try:
+        from openai import OpenAI
+        client = OpenAI(
+            api_key=get_setting("OPENAI_API_KEY"),
+            http_client=_get_httpx_client(),
+            max_retries=RETRIES,
+        )
+    except Exception:
+        return None
+
+    if not allow_images:
+        try:
+            client.images = _ImageStub()
+        except Exception:
+            # If monkeypatch fails for some reason, return None to be extra safe
+            return None
+    return client